@@ -9,6 +9,8 @@ from typing import Any, Dict, Optional, Tuple
 
 import requests
 
+from boundaries import save_boundary
+
 # City name aliases mapping - maps common names to their official City Strides names
 # Add aliases manually as needed
 CITY_ALIASES = {
@@ -212,6 +214,27 @@ def estimate_bbox_from_nominatim(
     return {"nelng": east, "nelat": north, "swlng": west, "swlat": south}
 
 
+def save_nominatim_boundary(city_name: str,
+                            nominatim_result: dict[str, Any]) -> None:
+    """
+    Keep the boundary polygon from a Nominatim result for clipping heat maps
+    """
+    geometry = nominatim_result.get("geojson")
+    if not geometry:
+        print("Nominatim did not return a boundary polygon")
+        return
+
+    try:
+        path = save_boundary(
+            format_city_name_for_file(city_name), geometry, {
+                "display_name": nominatim_result.get("display_name"),
+                "osm_id": nominatim_result.get("osm_id"),
+            })
+        print(f"✓ Saved boundary polygon to {path.name}")
+    except (OSError, ValueError) as e:
+        print(f"Could not save boundary polygon: {e}")
+
+
 def format_city_name_for_enum(city_name: str) -> str:
     """
     Format city name for use in the City enum (uppercase, underscores)
@@ -344,6 +367,7 @@ def main():
         if nominatim_result:
             bbox = estimate_bbox_from_nominatim(nominatim_result)
             print(f"Using bounding box from Nominatim: {bbox}")
+            save_nominatim_boundary(display_name, nominatim_result)
             if official_city_name:
                 print(f"   (Used official name '{search_name}' for search)")
 
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+"""Apply OpenStreetMap change files to the local ``data/<city>.json`` extracts.
+
+An osmChange file (``.osc`` or ``.osc.gz``, as published in the OSM replication
+diffs) lists created, modified and deleted nodes and ways.  Each city keeps a
+small id index, ``data/<city>.index.npz``, with its sorted node and way ids and
+bounding box, so a city is only loaded when the change touches one of its
+elements or creates a highway inside its bounding box.  Cost therefore follows
+the size of the edits rather than the size of the cities.
+
+Rewritten cities get ``osm3s.timestamp_osm_base`` advanced to the newest edit
+and their manifest entry refreshed; other derived files such as heat maps are
+reported as stale rather than rebuilt.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import xml.etree.ElementTree as ElementTree
+from pathlib import Path
+
+import numpy as np
+
+import city_manifest
+import create_heat_map as heat_map
+
+ROOT = Path(__file__).resolve().parent
+DATA_DIR = ROOT / "data"
+
+
+class OsmChange:
+    """The final state of every element an osmChange file touches."""
+
+    def __init__(self):
+        self.nodes: dict[int, tuple[float, float]] = {}
+        self.ways: dict[int, dict] = {}
+        self.deleted_nodes: set[int] = set()
+        self.deleted_ways: set[int] = set()
+        self.timestamp: str | None = None
+
+    def node_ids(self) -> np.ndarray:
+        return np.fromiter(self.nodes.keys() | self.deleted_nodes, dtype=np.int64)
+
+    def way_ids(self) -> np.ndarray:
+        return np.fromiter(self.ways.keys() | self.deleted_ways, dtype=np.int64)
+
+
+def read_change(path: Path) -> OsmChange:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rb") as handle:
+        root = ElementTree.parse(handle).getroot()
+    if root.tag != "osmChange":
+        raise ValueError(f"{path.name} is not an osmChange file")
+
+    change = OsmChange()
+    # Later actions win, so the file is replayed in order.
+    for action in root:
+        for element in action:
+            element_id = int(element.get("id"))
+            stamp = element.get("timestamp")
+            if stamp and (change.timestamp is None or stamp > change.timestamp):
+                change.timestamp = stamp
+
+            if element.tag == "node":
+                if action.tag == "delete":
+                    change.nodes.pop(element_id, None)
+                    change.deleted_nodes.add(element_id)
+                else:
+                    change.nodes[element_id] = float(element.get("lat")), float(element.get("lon"))
+                    change.deleted_nodes.discard(element_id)
+            elif element.tag == "way":
+                if action.tag == "delete":
+                    change.ways.pop(element_id, None)
+                    change.deleted_ways.add(element_id)
+                else:
+                    change.ways[element_id] = {
+                        "nodes": [int(nd.get("ref")) for nd in element.iter("nd")],
+                        "tags": {tag.get("k"): tag.get("v") for tag in element.iter("tag")},
+                    }
+                    change.deleted_ways.discard(element_id)
+    return change
+
+
+def index_path(city: str) -> Path:
+    return DATA_DIR / f"{city}.index.npz"
+
+
+def load_city_data(city: str) -> dict:
+    with (DATA_DIR / f"{city}.json").open(encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def write_index(city: str, data: dict) -> dict:
+    path = DATA_DIR / f"{city}.json"
+    nodes = heat_map.node_dictionary(data)
+    points = np.array(list(nodes.values()), dtype=float).reshape(-1, 2)
+    status = path.stat()
+    index = {
+        "node_ids": np.sort(np.fromiter(nodes, dtype=np.int64, count=len(nodes))),
+        "way_ids": np.sort(
+            np.array([e["id"] for e in data["elements"] if e["type"] == "way"], dtype=np.int64)
+        ),
+        "bbox": np.concatenate([points.min(axis=0), points.max(axis=0)])
+        if len(points)
+        else np.full(4, np.nan),
+        "source": np.array([status.st_size, status.st_mtime_ns], dtype=np.int64),
+    }
+    with index_path(city).open("wb") as handle:
+        np.savez(handle, **index)
+    return index
+
+
+def load_index(city: str) -> dict:
+    """Return the city's id index, rebuilding it if the dataset has changed."""
+
+    path = index_path(city)
+    status = (DATA_DIR / f"{city}.json").stat()
+    if path.exists():
+        with np.load(path) as stored:
+            index = {key: stored[key] for key in stored.files}
+        if index["source"].tolist() == [status.st_size, status.st_mtime_ns]:
+            return index
+    return write_index(city, load_city_data(city))
+
+
+def contains_any(sorted_ids: np.ndarray, ids: np.ndarray) -> bool:
+    if not len(sorted_ids) or not len(ids):
+        return False
+    positions = np.searchsorted(sorted_ids, ids).clip(max=len(sorted_ids) - 1)
+    return bool((sorted_ids[positions] == ids).any())
+
+
+def in_bbox(point: tuple[float, float], bbox: np.ndarray) -> bool:
+    return bool(bbox[0] <= point[0] <= bbox[2] and bbox[1] <= point[1] <= bbox[3])
+
+
+def new_highway(change: OsmChange, way: dict, node_ids: np.ndarray, bbox: np.ndarray) -> bool:
+    """Whether a way missing from a city belongs to it.
+
+    Created highways are assigned to every city whose bounding box contains
+    one of their nodes, which approximates the extract's Overpass area.
+    """
+
+    if "highway" not in way["tags"]:
+        return False
+    return contains_any(node_ids, np.array(way["nodes"], dtype=np.int64)) or any(
+        node_id in change.nodes and in_bbox(change.nodes[node_id], bbox)
+        for node_id in way["nodes"]
+    )
+
+
+def affects(change: OsmChange, index: dict) -> bool:
+    if contains_any(index["node_ids"], change.node_ids()):
+        return True
+    if contains_any(index["way_ids"], change.way_ids()):
+        return True
+    return any(
+        new_highway(change, way, index["node_ids"], index["bbox"])
+        for way in change.ways.values()
+    )
+
+
+def apply_change(data: dict, change: OsmChange, bbox: np.ndarray) -> dict[str, int]:
+    """Apply a change to one city's Overpass data in place and count the edits."""
+
+    nodes = {e["id"]: e for e in data["elements"] if e["type"] == "node"}
+    ways = {e["id"]: e for e in data["elements"] if e["type"] == "way"}
+    node_ids = np.sort(np.fromiter(nodes, dtype=np.int64, count=len(nodes)))
+    counts = dict.fromkeys(["ways", "nodes", "missing"], 0)
+
+    for way_id in change.deleted_ways & ways.keys():
+        del ways[way_id]
+        counts["ways"] += 1
+    for way_id, way in change.ways.items():
+        if way_id in ways or new_highway(change, way, node_ids, bbox):
+            updated = {"type": "way", "id": way_id, "nodes": way["nodes"], "tags": way["tags"]}
+            if ways.get(way_id) != updated:
+                ways[way_id] = updated
+                counts["ways"] += 1
+
+    for node_id in change.deleted_nodes & nodes.keys():
+        del nodes[node_id]
+        counts["nodes"] += 1
+    referenced = {node_id for way in ways.values() for node_id in way["nodes"]}
+    for node_id in referenced:
+        if node_id in change.nodes:
+            lat, lon = change.nodes[node_id]
+            node = nodes.setdefault(node_id, {"type": "node", "id": node_id})
+            if (node.get("lat"), node.get("lon")) != (lat, lon):
+                node["lat"], node["lon"] = lat, lon
+                counts["nodes"] += 1
+        elif node_id not in nodes:
+            counts["missing"] += 1
+    # The extracts hold only the nodes of their ways.
+    for node_id in nodes.keys() - referenced:
+        if "tags" not in nodes[node_id]:
+            del nodes[node_id]
+            counts["nodes"] += 1
+
+    data["elements"] = [*nodes.values(), *ways.values()]
+    if change.timestamp and (counts["ways"] or counts["nodes"]):
+        osm3s = data.setdefault("osm3s", {})
+        osm3s["timestamp_osm_base"] = max(osm3s.get("timestamp_osm_base", ""), change.timestamp)
+    return counts
+
+
+def write_city_data(city: str, data: dict) -> None:
+    path = DATA_DIR / f"{city}.json"
+    # Keep each extract's indentation, escaping and final newline so unchanged
+    # text stays identical.
+    original = path.read_bytes()
+    first_line = original.split(b"\n", 2)[1] if b"\n" in original else b""
+    indent = len(first_line) - len(first_line.lstrip(b" ")) or 2
+    text = json.dumps(data, indent=indent, ensure_ascii=original.isascii())
+    if original.endswith(b"\n"):
+        text += "\n"
+    temporary = path.with_name(path.name + ".tmp")
+    temporary.write_text(text, encoding="utf-8")
+    os.replace(temporary, path)
+
+
+def city_names() -> list[str]:
+    return sorted(path.stem for path in DATA_DIR.glob("*.json"))
+
+
+def apply_changes(changes: list[Path], cities: list[str]) -> dict[str, dict[str, int]]:
+    """Apply change files in order; return the edit counts per changed city."""
+
+    edited = {}
+    for path in changes:
+        change = read_change(path)
+        for city in cities:
+            index = load_index(city)
+            if not affects(change, index):
+                continue
+            data = load_city_data(city)
+            counts = apply_change(data, change, index["bbox"])
+            if counts["ways"] or counts["nodes"]:
+                write_city_data(city, data)
+                write_index(city, data)
+                totals = edited.setdefault(city, dict.fromkeys(counts, 0))
+                for key, value in counts.items():
+                    totals[key] += value
+    return edited
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Apply osmChange files to the local city datasets"
+    )
+    parser.add_argument("changes", nargs="+", type=Path, help=".osc or .osc.gz files, oldest first")
+    parser.add_argument(
+        "--city",
+        action="append",
+        dest="cities",
+        help="limit the update to this city (repeatable; default: every data/ city)",
+    )
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=ROOT / "parameters.yaml",
+        help="heat-map YAML settings for the manifest refresh (default: parameters.yaml)",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    cities = [heat_map.normalized_city_name(city) for city in args.cities or []] or city_names()
+    missing = [city for city in cities if not (DATA_DIR / f"{city}.json").exists()]
+    if missing:
+        print(f"✗ Missing city data: {', '.join(missing)}")
+        return 1
+
+    try:
+        edited = apply_changes(args.changes, cities)
+        if edited:
+            city_manifest.refresh_manifest(heat_map.load_settings(args.config))
+    except (OSError, ValueError, KeyError, json.JSONDecodeError, ElementTree.ParseError) as error:
+        print(f"✗ Could not apply changes: {error}")
+        return 1
+
+    for city, counts in edited.items():
+        print(f"✓ {city}: {counts['ways']:,} ways and {counts['nodes']:,} nodes changed")
+        if counts["missing"]:
+            print(f"  ℹ {counts['missing']:,} referenced nodes are not in the change or extract")
+        if (ROOT / "heat_maps" / f"{city}.html").exists():
+            print(f"  ℹ heat_maps/{city}.html is now stale")
+    if not edited:
+        print("ℹ No local city is affected by these changes")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""Compare the template heat-map renderer with a full plotly.express build.
+
+The baseline is the previous renderer: a ``px.scatter_map`` figure of every
+node serialised by ``figure.to_html``, with the same page additions.  Both
+write the same map, so the timing difference is plotly's per-point figure
+construction and validation.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import create_heat_map as heat_map
+
+
+def synthetic_frame(size: int, seed: int = 0) -> pd.DataFrame:
+    """Random short-street nodes scattered around Toronto."""
+
+    random = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "lat": 43.7 + random.normal(0, 0.05, size),
+            "lon": -79.4 + random.normal(0, 0.07, size),
+            "sz": 2,
+            "names": [f"Name: {index} (benchmark)" for index in range(size)],
+            "len_cat": random.uniform(0, 1, size),
+            "street": [f"Street {index // 12}" for index in range(size)],
+        }
+    )
+
+
+def plotly_express_html(frame: pd.DataFrame, map_style: str) -> str:
+    frame = frame.sort_values("len_cat", kind="stable", ignore_index=True)
+    center = {"lat": frame["lat"].mean(), "lon": frame["lon"].mean()}
+    figure = heat_map.scatter_figure(frame, map_style, center)
+    heat_map.style_figure(figure)
+    html = figure.to_html(
+        include_plotlyjs="cdn", config=heat_map.PLOT_CONFIG, div_id="heat-map-div"
+    )
+    thresholds = list(heat_map.DEFAULT_THRESHOLDS)
+    ends = heat_map.threshold_ends(frame, thresholds)
+    data_script = (
+        f"<script>window.originalData = {heat_map.original_data_json(frame)};\n"
+        f"window.thresholdEnds = {json.dumps(ends)};</script>"
+    )
+    head = f"{heat_map.CUSTOM_PAGE}{heat_map.LENGTH_FILTER}\n{data_script}"
+    html = html.replace("</head>", f"{head}\n</head>")
+    return html.replace("<body>", f"<body>\n{heat_map.length_controls(thresholds)}")
+
+
+def best_time(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "sizes",
+        nargs="*",
+        type=int,
+        default=[1_000, 10_000, 100_000],
+        help="node counts to render (default: 1000 10000 100000)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    # Warm the cached plotly.js SRI hash so it is not charged to one size.
+    heat_map.plotly_cdn_script()
+
+    print(f"{'nodes':>9} {'plotly.express':>15} {'template':>10} {'speed-up':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        output = Path(directory) / "heat_map.html"
+        for size in args.sizes:
+            frame = synthetic_frame(size)
+            express = best_time(
+                lambda frame=frame: plotly_express_html(frame, "open-street-map"),
+                args.repeat,
+            )
+            template = best_time(
+                lambda frame=frame: heat_map.write_heat_map_html(
+                    frame, "open-street-map", output
+                ),
+                args.repeat,
+            )
+            print(
+                f"{size:>9,} {express * 1000:>13.0f}ms {template * 1000:>8.0f}ms "
+                f"{express / template:>8.1f}x"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+"""City boundary polygons and a vectorized point-in-polygon test.
+
+Boundaries are stored as GeoJSON features in ``boundaries/<city>.geojson``.
+``add_new_city.py`` saves the polygon Nominatim returns for a new city, and
+``./boundaries.py CITY`` fetches one for a city that is already registered.
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent
+BOUNDARY_DIR = ROOT / "boundaries"
+
+
+def boundary_path(city: str) -> Path:
+    return BOUNDARY_DIR / f"{city}.geojson"
+
+
+def save_boundary(city: str, geometry: dict, properties: dict | None = None) -> Path:
+    if geometry.get("type") not in ("Polygon", "MultiPolygon"):
+        raise ValueError(f"{city} boundary is a {geometry.get('type')}, not a polygon")
+    path = boundary_path(city)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    feature = {
+        "type": "Feature",
+        "properties": {"city": city} | (properties or {}),
+        "geometry": geometry,
+    }
+    path.write_text(json.dumps(feature, ensure_ascii=False) + "\n", encoding="utf-8")
+    return path
+
+
+class Boundary:
+    """A polygon boundary prepared for repeated point-in-polygon queries.
+
+    Every ring of every polygon contributes its edges to one even-odd test, so
+    holes and multi-part cities need no special handling.
+    """
+
+    def __init__(self, geometry: dict):
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            raise ValueError(f"Unsupported boundary geometry {geometry['type']}")
+
+        rings = [np.asarray(ring, dtype=float)[:, :2] for polygon in polygons for ring in polygon]
+        starts = np.concatenate([ring[:-1] for ring in rings])
+        ends = np.concatenate([ring[1:] for ring in rings])
+        # Every edge as (x1, y1, x2, y2), for overlap tests against areas.
+        self.edges = np.column_stack([starts, ends])
+        # Horizontal edges never cross a horizontal ray.
+        sloped = starts[:, 1] != ends[:, 1]
+        self.x1, self.y1 = starts[sloped, 0], starts[sloped, 1]
+        self.x2, self.y2 = ends[sloped, 0], ends[sloped, 1]
+        self.y_low = np.minimum(self.y1, self.y2)
+        self.y_high = np.maximum(self.y1, self.y2)
+
+        points = np.concatenate(rings)
+        self.west, self.south = points.min(axis=0)
+        self.east, self.north = points.max(axis=0)
+
+    def contains(self, lat, lon) -> np.ndarray:
+        """Return a boolean mask of the points inside the boundary."""
+
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        inside = np.zeros(lat.shape, dtype=bool)
+        candidates = np.flatnonzero(
+            (lat >= self.south) & (lat <= self.north)
+            & (lon >= self.west) & (lon <= self.east)
+        )
+        if not len(candidates) or not len(self.y1):
+            return inside
+
+        # Sort the candidates by latitude so each edge only visits the points
+        # in its own latitude band; a ray from each point crosses few edges.
+        order = candidates[np.argsort(lat[candidates], kind="stable")]
+        ys = lat[order]
+        first = np.searchsorted(ys, self.y_low, side="left")
+        last = np.searchsorted(ys, self.y_high, side="left")
+        for edge in np.flatnonzero(last > first):
+            band = order[first[edge]:last[edge]]
+            x1, y1 = self.x1[edge], self.y1[edge]
+            slope = (self.x2[edge] - x1) / (self.y2[edge] - y1)
+            crossing = lon[band] < x1 + (lat[band] - y1) * slope
+            inside[band[crossing]] ^= True
+        return inside
+
+    def contains_nodes(self, nodes: dict[int, tuple[float, float]]) -> set[int]:
+        """Return the ids of the ``{id: (lat, lon)}`` nodes inside the boundary."""
+
+        ids = np.fromiter(nodes, dtype=np.int64, count=len(nodes))
+        points = np.array(list(nodes.values()), dtype=float).reshape(-1, 2)
+        return set(ids[self.contains(points[:, 0], points[:, 1])].tolist())
+
+
+def load_boundary(city: str) -> Boundary | None:
+    path = boundary_path(city)
+    if not path.exists():
+        return None
+    with path.open(encoding="utf-8") as handle:
+        feature = json.load(handle)
+    return Boundary(feature.get("geometry", feature))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Fetch and store a city's boundary polygon from Nominatim"
+    )
+    parser.add_argument("city", help="city dataset name, such as old_toronto")
+    parser.add_argument(
+        "--query", help="Nominatim search text (default: the city name)"
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    # Imported here so that using boundaries does not require requests.
+    from add_new_city import search_city_on_nominatim
+
+    args = parse_args()
+    city = args.city.lower().replace(" ", "_").replace("-", "_")
+    result = search_city_on_nominatim(args.query or city.replace("_", " "))
+    if not result or "geojson" not in result:
+        print(f"✗ No boundary polygon found for {city}")
+        return 1
+    try:
+        path = save_boundary(
+            city,
+            result["geojson"],
+            {"display_name": result.get("display_name"), "osm_id": result.get("osm_id")},
+        )
+    except (OSError, ValueError) as error:
+        print(f"✗ Could not save boundary: {error}")
+        return 1
+    print(f"✓ Saved {path.relative_to(ROOT)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
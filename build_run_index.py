@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+"""Rebuild index.html and past_runs.html from cached per-run summaries.
+
+Each run page embeds its route as a ``routeData`` JSON script.  Parsing those
+140–185 KB pages is the only expensive step, so the extracted metadata is kept
+in ``summaries.json`` beside the pages, keyed by the SHA-256 of each file, and
+only new or edited pages are opened again.
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+UPCOMING_DIR = ROOT / "upcoming_runs"
+PAST_DIR = ROOT / "past_runs"
+COMPLETED_FILE = PAST_DIR / "completed.json"
+SUMMARY_NAME = "summaries.json"
+
+ROUTE_DATA = re.compile(
+    r'<script id="routeData" type="application/json">(.*?)</script>', re.DOTALL
+)
+# e.g. etobicoke-manual-manual-25-0km-43-65124-79-57970
+RUN_NAME = re.compile(
+    r"^(?P<city>[^-]+)-(?P<source>[^-]+)-(?P<strategy>[^-]+)-"
+    r"(?P<km>\d+)-(?P<tenths>\d)km-"
+)
+
+
+def file_sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def route_bbox(route: list[list[float]]) -> list[float] | None:
+    """Return ``[south, west, north, east]`` for a route, if it has points."""
+
+    if not route:
+        return None
+    lats = [point[0] for point in route]
+    lons = [point[1] for point in route]
+    return [min(lats), min(lons), max(lats), max(lons)]
+
+
+def summarize_run(path: Path, sha256: str) -> dict:
+    """Extract the metadata an index card needs from one run page."""
+
+    match = ROUTE_DATA.search(path.read_text(encoding="utf-8"))
+    if not match:
+        raise ValueError(f"{path.name} has no routeData script")
+    data = json.loads(match.group(1))
+
+    name = RUN_NAME.match(path.stem)
+    city = name["city"] if name else path.stem.split("-", 1)[0]
+    route = data.get("route", [])
+    return {
+        "sha256": sha256,
+        "city": city,
+        "title": data.get("title") or f"{city.replace('_', ' ').title()} route",
+        "planned_km": float(f"{name['km']}.{name['tenths']}") if name else None,
+        "distance_km": data.get("distance_km"),
+        "start": route[0] if route else None,
+        "bbox": route_bbox(route),
+        "route_points": len(route),
+        "node_count": len(data.get("nodes", [])),
+        "street_count": len(data.get("streets", [])),
+        "generated_at": data.get("target_generated_at"),
+    }
+
+
+def load_summaries(directory: Path) -> dict[str, dict]:
+    path = directory / SUMMARY_NAME
+    if not path.exists():
+        return {}
+    with path.open(encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def write_json_if_changed(path: Path, data: dict) -> bool:
+    text = json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False) + "\n"
+    if path.exists() and path.read_text(encoding="utf-8") == text:
+        return False
+    temporary = path.with_suffix(path.suffix + ".tmp")
+    temporary.write_text(text, encoding="utf-8")
+    os.replace(temporary, path)
+    return True
+
+
+def refresh_summaries(directory: Path) -> tuple[dict[str, dict], int]:
+    """Update a directory's summary cache, reparsing only changed run pages.
+
+    Returns the summaries and the number of pages that had to be parsed.
+    """
+
+    cached = load_summaries(directory)
+    summaries = {}
+    parsed = 0
+    for path in sorted(directory.glob("*.html")):
+        sha256 = file_sha256(path)
+        previous = cached.get(path.name)
+        if previous and previous.get("sha256") == sha256:
+            summaries[path.name] = previous
+            continue
+        summaries[path.name] = summarize_run(path, sha256)
+        parsed += 1
+
+    write_json_if_changed(directory / SUMMARY_NAME, summaries)
+    return summaries, parsed
+
+
+def load_completed() -> dict[str, str]:
+    if not COMPLETED_FILE.exists():
+        return {}
+    with COMPLETED_FILE.open(encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def completed_label(timestamp: str) -> str:
+    moment = datetime.fromisoformat(timestamp)
+    hour = moment.hour % 12 or 12
+    meridiem = "AM" if moment.hour < 12 else "PM"
+    return (
+        f"Completed {moment:%b} {moment.day}, {moment.year} "
+        f"at {hour}:{moment:%M} {meridiem}"
+    )
+
+
+def run_card(folder: str, filename: str, summary: dict, note: str = "") -> str:
+    stem = Path(filename).stem
+    distance = summary.get("distance_km")
+    if distance is None:
+        distance = summary.get("planned_km") or 0.0
+    detail = f"{html.escape(note)}<br>{html.escape(stem)}" if note else html.escape(stem)
+    return (
+        f'<a class="run" href="{folder}/{html.escape(filename)}">\n'
+        f"  <strong>{html.escape(summary['title'])}</strong>\n"
+        f"  <span>{distance:.1f} km</span>\n"
+        f"  <small>{detail}</small>\n"
+        "</a>\n"
+    )
+
+
+def upcoming_cards(summaries: dict[str, dict]) -> str:
+    ordered = sorted(
+        summaries,
+        key=lambda name: (summaries[name].get("generated_at") or "", name),
+        reverse=True,
+    )
+    if not ordered:
+        return '<div class="empty">No upcoming runs yet.</div>\n'
+    return "".join(
+        run_card(UPCOMING_DIR.name, name, summaries[name]) for name in ordered
+    )
+
+
+def past_cards(summaries: dict[str, dict], completed: dict[str, str]) -> str:
+    def completion_time(name: str) -> datetime:
+        timestamp = completed.get(name)
+        return datetime.fromisoformat(timestamp) if timestamp else datetime.min.astimezone()
+
+    ordered = sorted(summaries, key=completion_time, reverse=True)
+    if not ordered:
+        return '<div class="empty">No completed runs yet.</div>\n'
+    return "".join(
+        run_card(
+            PAST_DIR.name,
+            name,
+            summaries[name],
+            completed_label(completed[name]) if name in completed else "",
+        )
+        for name in ordered
+    )
+
+
+def replace_section(page: Path, marker: str, cards: str) -> bool:
+    """Replace the cards between a page's START/END markers if they differ."""
+
+    start = f"<!-- {marker}_START -->\n"
+    end = f"<!-- {marker}_END -->"
+    text = page.read_text(encoding="utf-8")
+    head, found, rest = text.partition(start)
+    if not found or end not in rest:
+        raise ValueError(f"{page.name} is missing its {marker} markers")
+    updated = head + start + cards + end + rest.split(end, 1)[1]
+    if updated == text:
+        return False
+    page.write_text(updated, encoding="utf-8")
+    return True
+
+
+def complete_run(filename: str, when: datetime | None = None) -> None:
+    """Move one upcoming run to past_runs and record when it was completed.
+
+    The run's cached summary moves with it, so completing a run never reparses
+    any page.
+    """
+
+    source = UPCOMING_DIR / filename
+    if not source.is_file():
+        raise ValueError(f"{filename} is not an upcoming run")
+
+    upcoming = load_summaries(UPCOMING_DIR)
+    past = load_summaries(PAST_DIR)
+    completed = load_completed()
+
+    PAST_DIR.mkdir(exist_ok=True)
+    shutil.move(source, PAST_DIR / filename)
+    if filename in upcoming:
+        past[filename] = upcoming.pop(filename)
+    completed[filename] = (when or datetime.now().astimezone()).isoformat()
+
+    write_json_if_changed(UPCOMING_DIR / SUMMARY_NAME, upcoming)
+    write_json_if_changed(PAST_DIR / SUMMARY_NAME, past)
+    write_json_if_changed(COMPLETED_FILE, completed)
+
+
+def build_indexes() -> None:
+    upcoming, parsed_upcoming = refresh_summaries(UPCOMING_DIR)
+    past, parsed_past = refresh_summaries(PAST_DIR)
+    completed = load_completed()
+
+    changed = [
+        page.name
+        for page, marker, cards in (
+            (ROOT / "index.html", "UPCOMING_RUNS", upcoming_cards(upcoming)),
+            (ROOT / "past_runs.html", "PAST_RUNS", past_cards(past, completed)),
+        )
+        if replace_section(page, marker, cards)
+    ]
+    print(
+        f"✓ {len(upcoming)} upcoming and {len(past)} past runs "
+        f"({parsed_upcoming + parsed_past} pages parsed)"
+    )
+    print(f"✓ Updated {', '.join(changed)}" if changed else "ℹ Indexes already current")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Rebuild the upcoming and past run index pages"
+    )
+    parser.add_argument(
+        "--complete",
+        metavar="FILENAME",
+        help="move an upcoming run page to past_runs before rebuilding",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        if args.complete:
+            complete_run(Path(args.complete).name)
+            print(f"✓ Completed {args.complete}")
+        build_indexes()
+    except (OSError, ValueError, KeyError, json.JSONDecodeError) as error:
+        print(f"✗ Could not build run indexes: {error}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+"""Check a faster heat-map engine against the current node selection.
+
+A candidate is a module that defines any of ``process_city_data``,
+``is_close_to_citystrides_node`` and ``write_nodes_csv``; the functions it
+leaves out are taken from ``create_heat_map``.  Both engines write the
+``nodes.csv`` of every city that has a dataset and a ``csnodes/`` file, and the
+rows are compared with a tolerance on the float columns.
+
+Reference results are cached in ``reference_nodes/`` with their run time,
+keyed by the city's input files, the settings and the reference functions'
+source, so a sweep only reruns the reference for what has changed.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import importlib
+import inspect
+import io
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import boundaries
+import create_heat_map as heat_map
+
+ROOT = heat_map.ROOT
+REFERENCE_DIR = ROOT / "reference_nodes"
+ENGINE_FUNCTIONS = ["process_city_data", "is_close_to_citystrides_node", "write_nodes_csv"]
+FLOAT_COLUMNS = ["lat", "lon", "len_cat"]
+# Everything the reference selection reads; editing one invalidates the cache.
+REFERENCE_SOURCES = [
+    heat_map.length_thresholds,
+    heat_map.length_ceiling,
+    heat_map.load_city_data,
+    heat_map.node_dictionary,
+    heat_map.street_dictionary,
+    heat_map.distance_km,
+    heat_map.total_distance_km,
+    heat_map.point_bucket,
+    heat_map.load_covered_points,
+    heat_map.load_citystrides_points,
+    heat_map.ids_match_osm,
+    heat_map.is_close_to_citystrides_node,
+    heat_map.find_citystrides_file,
+    heat_map.street_paths,
+    heat_map.process_city_data,
+    heat_map.write_nodes_csv,
+    boundaries,
+]
+EXAMPLES = 3
+
+
+def bundled_cities() -> list[str]:
+    """Cities with both an OSM dataset and a CityStrides target file."""
+
+    return sorted(
+        path.stem
+        for path in (ROOT / "data").glob("*.json")
+        if heat_map.find_citystrides_file(path.stem)
+    )
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def reference_key(city: str, settings: dict) -> str:
+    digest = hashlib.sha256()
+    for source in REFERENCE_SOURCES:
+        digest.update(inspect.getsource(source).encode("utf-8"))
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode("utf-8"))
+    citystrides_file = heat_map.find_citystrides_file(city)
+    inputs = [ROOT / "data" / f"{city}.json", boundaries.boundary_path(city)]
+    if citystrides_file:
+        inputs += [citystrides_file, heat_map.covered_targets_file(citystrides_file)]
+    for path in inputs:
+        digest.update(f"{path.name}:{file_digest(path) if path.exists() else '-'}".encode())
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def engine(candidate):
+    """Install the candidate's functions in ``create_heat_map`` for a run."""
+
+    originals = {name: getattr(heat_map, name) for name in ENGINE_FUNCTIONS}
+    try:
+        for name in ENGINE_FUNCTIONS:
+            setattr(heat_map, name, getattr(candidate, name, originals[name]))
+        yield
+    finally:
+        for name, function in originals.items():
+            setattr(heat_map, name, function)
+
+
+def run_engine(city: str, settings: dict, output: Path) -> float:
+    """Write one city's nodes.csv with the installed engine; return seconds."""
+
+    # The selection reports its progress; only the output is compared here.
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        started = time.perf_counter()
+        heat_map.write_nodes_csv(heat_map.process_city_data(city, settings), output)
+        return time.perf_counter() - started
+
+
+def reference_nodes(city: str, settings: dict, refresh: bool = False) -> tuple[Path, float, bool]:
+    """Return the reference nodes.csv, its run time and whether it was cached."""
+
+    output = REFERENCE_DIR / f"{city}.csv"
+    meta = output.with_suffix(".json")
+    key = reference_key(city, settings)
+    if not refresh and output.exists() and meta.exists():
+        with meta.open(encoding="utf-8") as handle:
+            stored = json.load(handle)
+        if stored.get("key") == key:
+            return output, stored["seconds"], True
+
+    seconds = run_engine(city, settings, output)
+    meta.write_text(json.dumps({"key": key, "seconds": seconds}, indent=2) + "\n", encoding="utf-8")
+    return output, seconds, False
+
+
+def compare_nodes(reference: Path, candidate: Path, tolerance: float, any_order: bool) -> list[str]:
+    """Describe how two nodes.csv files differ; an empty list means they agree."""
+
+    expected = pd.read_csv(reference, keep_default_na=False)
+    actual = pd.read_csv(candidate, keep_default_na=False)
+    if list(actual.columns) != list(expected.columns):
+        return [f"columns {list(actual.columns)} instead of {list(expected.columns)}"]
+
+    problems = []
+    if any_order or len(actual) != len(expected):
+        # Node names are unique, so rows can be paired by them.
+        missing = sorted(set(expected["names"]) - set(actual["names"]))
+        extra = sorted(set(actual["names"]) - set(expected["names"]))
+        if missing:
+            problems.append(f"{len(missing):,} rows missing, e.g. {missing[:EXAMPLES]}")
+        if extra:
+            problems.append(f"{len(extra):,} extra rows, e.g. {extra[:EXAMPLES]}")
+        if missing or extra:
+            return problems
+        expected = expected.sort_values("names", ignore_index=True)
+        actual = actual.sort_values("names", ignore_index=True)
+
+    for column in expected.columns:
+        if column in FLOAT_COLUMNS:
+            same = np.isclose(actual[column], expected[column], rtol=0, atol=tolerance)
+        else:
+            same = (actual[column].astype(str) == expected[column].astype(str)).to_numpy()
+        if not same.all():
+            rows = np.flatnonzero(~same)
+            examples = [
+                f"{expected.at[row, 'names']}: {actual.at[row, column]!r} != "
+                f"{expected.at[row, column]!r}"
+                for row in rows[:EXAMPLES]
+            ]
+            problems.append(f"{len(rows):,} differ in {column}, e.g. {'; '.join(examples)}")
+    return problems
+
+
+def check_city(
+    city: str,
+    settings: dict,
+    candidate,
+    tolerance: float = 1e-9,
+    any_order: bool = False,
+    refresh: bool = False,
+) -> dict:
+    reference, reference_seconds, cached = reference_nodes(city, settings, refresh)
+    output = REFERENCE_DIR / f"{city}.candidate.csv"
+    with engine(candidate):
+        candidate_seconds = run_engine(city, settings, output)
+    problems = compare_nodes(reference, output, tolerance, any_order)
+    output.unlink()
+    return {
+        "city": city,
+        "rows": len(pd.read_csv(reference, usecols=["names"])),
+        "reference_seconds": reference_seconds,
+        "cached": cached,
+        "candidate_seconds": candidate_seconds,
+        "problems": problems,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "candidate", help="module defining the candidate engine, such as fast_heat_map"
+    )
+    parser.add_argument(
+        "cities",
+        nargs="*",
+        help="cities to check (default: every dataset with a csnodes file)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1e-9,
+        help="largest accepted difference in lat, lon and len_cat (default: 1e-9)",
+    )
+    parser.add_argument(
+        "--any-order", action="store_true", help="pair rows by node name instead of position"
+    )
+    parser.add_argument(
+        "--refresh", action="store_true", help="rerun the reference even when cached"
+    )
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=ROOT / "parameters.yaml",
+        help="heat-map YAML settings (default: parameters.yaml)",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        candidate = importlib.import_module(args.candidate)
+        settings = heat_map.load_settings(args.config)
+        cities = [heat_map.normalized_city_name(city) for city in args.cities] or bundled_cities()
+        REFERENCE_DIR.mkdir(exist_ok=True)
+
+        failed = 0
+        print(f"  {'city':<18} {'rows':>8} {'reference':>11} {'candidate':>10} {'speed-up':>9}")
+        for city in cities:
+            result = check_city(
+                city, settings, candidate, args.tolerance, args.any_order, args.refresh
+            )
+            marker = "*" if result["cached"] else " "
+            print(
+                f"{'✓' if not result['problems'] else '✗'} {city:<18} {result['rows']:>8,} "
+                f"{result['reference_seconds']:>9.2f}s{marker} "
+                f"{result['candidate_seconds']:>9.2f}s "
+                f"{result['reference_seconds'] / max(result['candidate_seconds'], 1e-9):>8.1f}x"
+            )
+            for problem in result["problems"]:
+                print(f"    {problem}")
+            failed += bool(result["problems"])
+    except (OSError, ValueError, KeyError, ImportError, json.JSONDecodeError) as error:
+        print(f"✗ Could not check {args.candidate}: {error}")
+        return 1
+
+    print("* cached reference time")
+    if failed:
+        print(f"✗ {failed} of {len(cities)} cities differ from the reference")
+        return 1
+    print(f"✓ {len(cities)} cities match the reference")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
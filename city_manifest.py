@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+
+"""Maintain city_manifest.json, a summary of every dataset in the repository.
+
+Each city entry records the files found in ``data/``, ``csnodes/`` and
+``cache/`` with their sizes, hashes and headline statistics.  A file is only
+reopened when its size or modification time changes and its SHA-256 no longer
+matches, so listing, validating or selecting cities never loads a dataset.
+"""
+
+import argparse
+import csv
+import hashlib
+import html
+import json
+import os
+from pathlib import Path
+
+import create_heat_map as heat_map
+
+ROOT = heat_map.ROOT
+MANIFEST = ROOT / "city_manifest.json"
+SCHEMA_VERSION = 1
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def bbox_of(points) -> list[float] | None:
+    """Return ``[south, west, north, east]`` for ``(lat, lon)`` pairs."""
+
+    south = west = float("inf")
+    north = east = float("-inf")
+    for lat, lon in points:
+        south, north = min(south, lat), max(north, lat)
+        west, east = min(west, lon), max(east, lon)
+    return None if south == float("inf") else [south, west, north, east]
+
+
+def data_stats(path: Path, max_length: float) -> dict:
+    with path.open(encoding="utf-8") as handle:
+        data = json.load(handle)
+    nodes = heat_map.node_dictionary(data)
+    streets = heat_map.street_dictionary(data)
+    lengths = [heat_map.total_distance_km(paths, nodes) for paths in streets.values()]
+    short = [length for length in lengths if length < max_length]
+    return {
+        "bbox": bbox_of(nodes.values()),
+        "nodes": len(nodes),
+        "ways": sum(len(paths) for paths in streets.values()),
+        "streets": len(streets),
+        "short_streets": len(short),
+        "short_street_km": round(sum(short), 3),
+        "short_street_max_km": max_length,
+        "osm_timestamp": data.get("osm3s", {}).get("timestamp_osm_base"),
+    }
+
+
+def csnodes_stats(path: Path) -> dict:
+    with path.open(newline="", encoding="utf-8") as handle:
+        reader = csv.reader(handle)
+        header = next(reader, [])
+        points = [(float(row[0]), float(row[1])) for row in reader if row]
+    return {
+        "rows": len(points),
+        "bbox": bbox_of(points),
+        "has_node_ids": "node_id" in header,
+    }
+
+
+def cache_stats(path: Path) -> dict:
+    """Tiles in a ``cache/<city>.csv`` download grid (nelng, nelat, swlng, swlat)."""
+
+    with path.open(newline="", encoding="utf-8") as handle:
+        tiles = [list(map(float, row)) for row in csv.reader(handle) if row]
+    return {
+        "tiles": len(tiles),
+        "bbox": bbox_of(
+            point for nelng, nelat, swlng, swlat in tiles
+            for point in ((swlat, swlng), (nelat, nelng))
+        ),
+    }
+
+
+def file_entry(path: Path, previous: dict | None, stats) -> tuple[dict, bool]:
+    """Describe one file, reusing ``previous`` when the file is unchanged.
+
+    Returns the entry and whether the file had to be parsed again.
+    """
+
+    status = path.stat()
+    identity = {
+        "path": path.relative_to(ROOT).as_posix(),
+        "size": status.st_size,
+        "mtime_ns": status.st_mtime_ns,
+    }
+    if previous and all(previous.get(key) == value for key, value in identity.items()):
+        return previous, False
+
+    sha256 = file_sha256(path)
+    if previous and previous.get("sha256") == sha256 and previous.get("path") == identity["path"]:
+        return previous | identity, False
+    return identity | {"sha256": sha256} | stats(path), True
+
+
+def city_names() -> list[str]:
+    names = {path.stem for path in (ROOT / "data").glob("*.json")}
+    names |= {path.stem for path in (ROOT / "csnodes").glob("*.csv")}
+    names |= {path.stem for path in (ROOT / "cache").glob("*.csv")}
+    # Derived files such as tiny.covered.csv or tiny.planned.csv are not cities.
+    return sorted(name for name in names if "." not in name)
+
+
+def load_manifest(path: Path = MANIFEST) -> dict:
+    if not path.exists():
+        return {"schema_version": SCHEMA_VERSION, "cities": {}}
+    with path.open(encoding="utf-8") as handle:
+        manifest = json.load(handle)
+    if manifest.get("schema_version") != SCHEMA_VERSION:
+        return {"schema_version": SCHEMA_VERSION, "cities": {}}
+    return manifest
+
+
+def refresh_manifest(settings: dict, path: Path = MANIFEST) -> tuple[dict, int]:
+    """Bring the manifest up to date and return it with the number of files parsed."""
+
+    manifest = load_manifest(path)
+    max_length = float(settings["heat_map_max_length"])
+    cities = {}
+    parsed = 0
+
+    for city in city_names():
+        previous = manifest["cities"].get(city, {})
+        entry = {}
+
+        data_path = ROOT / "data" / f"{city}.json"
+        if data_path.exists():
+            old = previous.get("data")
+            if old and old.get("short_street_max_km") != max_length:
+                old = None
+            entry["data"], changed = file_entry(
+                data_path, old, lambda path: data_stats(path, max_length)
+            )
+            parsed += changed
+
+        csnodes_path = heat_map.find_citystrides_file(city)
+        if csnodes_path:
+            entry["csnodes"], changed = file_entry(
+                csnodes_path, previous.get("csnodes"), csnodes_stats
+            )
+            parsed += changed
+
+        cache_path = ROOT / "cache" / f"{city}.csv"
+        if cache_path.exists():
+            entry["cache"], changed = file_entry(
+                cache_path, previous.get("cache"), cache_stats
+            )
+            parsed += changed
+
+        cities[city] = entry
+
+    manifest = {"schema_version": SCHEMA_VERSION, "cities": cities}
+    text = json.dumps(manifest, indent=1, sort_keys=True, ensure_ascii=False) + "\n"
+    if not path.exists() or path.read_text(encoding="utf-8") != text:
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(text, encoding="utf-8")
+        os.replace(temporary, path)
+    return manifest, parsed
+
+
+def validate_manifest(manifest: dict) -> list[str]:
+    """Return problems that can be found from the manifest and file metadata."""
+
+    problems = []
+    for city, entry in manifest["cities"].items():
+        if "data" in entry and "csnodes" not in entry:
+            problems.append(f"{city}: no CityStrides targets in csnodes/")
+        csnodes = entry.get("csnodes")
+        if not csnodes:
+            continue
+        meta_path = ROOT / "csnodes" / f"{Path(csnodes['path']).stem}.meta.json"
+        if not meta_path.exists():
+            continue
+        with meta_path.open(encoding="utf-8") as handle:
+            meta = json.load(handle)
+        if meta.get("sha256") != csnodes["sha256"]:
+            problems.append(f"{city}: {csnodes['path']} does not match its meta.json hash")
+        if meta.get("node_count") not in (None, csnodes["rows"]):
+            problems.append(
+                f"{city}: {csnodes['path']} has {csnodes['rows']} rows, "
+                f"meta.json expects {meta['node_count']}"
+            )
+    return problems
+
+
+def city_bbox(entry: dict) -> list[float] | None:
+    for kind in ("data", "csnodes", "cache"):
+        if entry.get(kind, {}).get("bbox"):
+            return entry[kind]["bbox"]
+    return None
+
+
+def cities_within(manifest: dict, bbox: list[float]) -> list[str]:
+    """Cities whose bounding box intersects ``[south, west, north, east]``."""
+
+    south, west, north, east = bbox
+    return [
+        city
+        for city, entry in manifest["cities"].items()
+        if (box := city_bbox(entry))
+        and box[0] <= north and box[2] >= south and box[1] <= east and box[3] >= west
+    ]
+
+
+def overview_rows(manifest: dict) -> list[list[str]]:
+    def count(entry: dict, kind: str, key: str) -> str:
+        value = entry.get(kind, {}).get(key)
+        return "" if value is None else f"{value:,}"
+
+    return [
+        [
+            city,
+            count(entry, "data", "nodes"),
+            count(entry, "data", "streets"),
+            count(entry, "data", "short_streets"),
+            count(entry, "data", "short_street_km"),
+            entry.get("csnodes", {}).get("path", ""),
+            count(entry, "csnodes", "rows"),
+            count(entry, "cache", "tiles"),
+        ]
+        for city, entry in manifest["cities"].items()
+    ]
+
+
+OVERVIEW_COLUMNS = [
+    "City",
+    "OSM nodes",
+    "Streets",
+    "Short streets",
+    "Short km",
+    "CityStrides targets",
+    "Target rows",
+    "Download tiles",
+]
+
+
+def write_overview_html(manifest: dict, path: Path) -> None:
+    header = "".join(f"<th>{column}</th>" for column in OVERVIEW_COLUMNS)
+    body = "\n".join(
+        "<tr>" + "".join(f"<td>{html.escape(value)}</td>" for value in row) + "</tr>"
+        for row in overview_rows(manifest)
+    )
+    path.write_text(
+        '<!doctype html>\n<html lang="en">\n<head>\n'
+        '  <meta charset="utf-8">\n  <title>City datasets</title>\n'
+        "  <style>\n"
+        "    body { margin:24px; font:14px/1.4 ui-sans-serif,system-ui,sans-serif; }\n"
+        "    table { border-collapse:collapse; }\n"
+        "    th, td { padding:4px 10px; border-bottom:1px solid #ddd; text-align:right; }\n"
+        "    th:first-child, td:first-child, td:nth-child(6) { text-align:left; }\n"
+        "  </style>\n</head>\n<body>\n"
+        f"<h1>City datasets</h1>\n<table>\n<tr>{header}</tr>\n{body}\n</table>\n"
+        "</body>\n</html>\n",
+        encoding="utf-8",
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Refresh and query the city dataset manifest"
+    )
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=ROOT / "parameters.yaml",
+        help="heat-map YAML settings for short-street totals (default: parameters.yaml)",
+    )
+    parser.add_argument("--list", action="store_true", help="print one line per city")
+    parser.add_argument(
+        "--check", action="store_true", help="report inconsistent or missing files"
+    )
+    parser.add_argument(
+        "--within",
+        type=heat_map.parse_bbox,
+        metavar="S,W,N,E",
+        help="print the cities whose bounding box intersects this one",
+    )
+    parser.add_argument("--html", type=Path, help="write an overview page")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        manifest, parsed = refresh_manifest(heat_map.load_settings(args.config))
+    except (OSError, ValueError, KeyError, json.JSONDecodeError) as error:
+        print(f"✗ Could not refresh {MANIFEST.name}: {error}")
+        return 1
+    print(f"✓ {len(manifest['cities'])} cities in {MANIFEST.name} ({parsed} files parsed)")
+
+    if args.list:
+        for row in overview_rows(manifest):
+            print("  ".join(row))
+    if args.within:
+        print("\n".join(cities_within(manifest, args.within)))
+    if args.html:
+        write_overview_html(manifest, args.html)
+        print(f"✓ Created {args.html}")
+    if args.check:
+        problems = validate_manifest(manifest)
+        for problem in problems:
+            print(f"✗ {problem}")
+        if problems:
+            return 1
+        print("✓ All datasets are consistent")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,21 +3,39 @@
 """Build one interactive heat map from one or more city datasets."""
 
 import argparse
+import base64
 import csv
+import hashlib
 import json
+import os
+import sqlite3
+import time
 from collections import defaultdict
+from functools import cache
 from itertools import chain
 from math import sqrt
 from pathlib import Path
+from random import Random
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 import yaml
 from geopy.distance import geodesic
+from plotly.colors import sample_colorscale
+from plotly.io.json import to_json_plotly
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
 from tqdm import tqdm
 
+from boundaries import load_boundary
+from hotspots import cluster_hotspots
+from static_assets import ASSET_DIR, precompress, write_asset
+
 ROOT = Path(__file__).resolve().parent
-NODE_COLUMNS = ["lat", "lon", "sz", "names", "len_cat"]
+NODE_COLUMNS = ["lat", "lon", "sz", "names", "len_cat", "street"]
+# Columns embedded in the page for the client-side length filter.
+PAGE_COLUMNS = ["lat", "lon", "sz", "names", "len_cat"]
 
 # City aliases used by CityStrides CSV filenames.
 CITY_ALIASES = {
@@ -35,11 +53,23 @@ def citystrides_city_name(city: str) -> str:
     return CITY_ALIASES.get(normalized, normalized)
 
 
+# Street-length choices, in km, offered by the page's filter.
+DEFAULT_THRESHOLDS = (0.5, 1.0, 2.0)
+
+
 def load_settings(path: Path) -> dict:
     defaults = {
         "map_style": "open-street-map",
         "heat_map_max_length": 1.0,
+        "heat_map_thresholds": list(DEFAULT_THRESHOLDS),
         "heat_map_exclude_csnodes": True,
+        "heat_map_clip_to_boundary": True,
+        "heat_map_hotspots": False,
+        "hotspot_cell_km": 0.25,
+        "hotspot_min_nodes": 8,
+        "heat_map_mode": "points",
+        "heat_map_raster_cell_km": 0.1,
+        "heat_map_simplify_m": 5.0,
     }
     if not path.exists():
         print(f"ℹ {path.name} not found; using heat-map defaults")
@@ -52,6 +82,16 @@ def load_settings(path: Path) -> dict:
     return defaults | supplied
 
 
+def length_thresholds(settings: dict) -> list[float]:
+    return sorted({float(threshold) for threshold in settings["heat_map_thresholds"]})
+
+
+def length_ceiling(settings: dict) -> float:
+    """Longest street whose nodes are emitted: every threshold must be served."""
+
+    return max([*length_thresholds(settings), float(settings["heat_map_max_length"])])
+
+
 def load_city_data(city: str) -> dict:
     path = ROOT / "data" / f"{city}.json"
     with path.open(encoding="utf-8") as handle:
@@ -99,17 +139,79 @@ def point_bucket(point: tuple[float, float]) -> tuple[float, float]:
     return round(point[0], 3), round(point[1], 3)
 
 
-def load_citystrides_points(path: Path) -> dict:
+# Columns that may carry the OSM id of a CityStrides target, best first.
+CITYSTRIDES_ID_COLUMNS = ["osm_node_id", "node_id"]
+# Shared ids checked against OSM coordinates before trusting the id join.
+ID_JOIN_SAMPLE = 50
+
+
+def covered_targets_file(path: Path) -> Path:
+    """Targets of ``csnodes/<city>.csv`` that completed runs have since covered."""
+
+    return path.with_name(f"{path.stem}.covered.csv")
+
+
+def load_covered_points(path: Path) -> set[tuple[float, float]]:
+    covered = covered_targets_file(path)
+    if not covered.exists():
+        return set()
+    with covered.open(newline="", encoding="utf-8") as handle:
+        return {(float(row["lat"]), float(row["lon"])) for row in csv.DictReader(handle)}
+
+
+def load_citystrides_points(
+    path: Path, ids: dict[int, tuple[float, float]] | None = None
+) -> dict:
+    """Bucket CityStrides target points for the spatial match.
+
+    When ``ids`` is given and the file has a node id column, each target's
+    point is also recorded there by id for the exact join.  Targets listed in
+    the city's ``.covered.csv`` were run after the download and are skipped.
+    """
+
     points = defaultdict(set)
+    id_column = None
+    covered = load_covered_points(path)
     with path.open(newline="", encoding="utf-8") as handle:
         for row in csv.reader(handle):
-            if not row or row[0] == "lat":
+            if not row:
+                continue
+            if row[0] == "lat":
+                id_column = next(
+                    (row.index(name) for name in CITYSTRIDES_ID_COLUMNS if name in row),
+                    None,
+                )
                 continue
             point = float(row[0]), float(row[1])
+            if point in covered:
+                continue
             points[point_bucket(point)].add(point)
+            if ids is None or id_column is None:
+                continue
+            # Rows with a blank or malformed id are left to the spatial match.
+            node_id = row[id_column].strip() if len(row) > id_column else ""
+            if node_id.removeprefix("-").isdigit():
+                ids[int(node_id)] = point
     return points
 
 
+def ids_match_osm(
+    ids: dict[int, tuple[float, float]],
+    nodes: dict[int, tuple[float, float]],
+    threshold_km: float = 0.01,
+) -> bool:
+    """Whether the CityStrides node ids are OSM node ids.
+
+    Older downloads carry CityStrides' own node ids, which may collide with
+    unrelated OSM ids, so a sample of shared ids must also agree on position.
+    """
+
+    shared = [node_id for node_id in ids if node_id in nodes][:ID_JOIN_SAMPLE]
+    return bool(shared) and all(
+        geodesic(ids[node_id], nodes[node_id]).km < threshold_km for node_id in shared
+    )
+
+
 def is_close_to_citystrides_node(
     points: dict,
     point: tuple[float, float],
@@ -129,56 +231,169 @@ def find_citystrides_file(city: str) -> Path | None:
     return next((path for path in candidates if path.exists()), None)
 
 
-def process_city_data(city: str, settings: dict) -> list[list]:
-    """Return the short-street nodes that should appear for one city."""
+def street_paths(
+    paths: list[list[int]],
+    nodes: dict[int, tuple[float, float]],
+    inside: set[int] | None = None,
+) -> list[np.ndarray]:
+    """Return ``(lat, lon)`` arrays for a street's ways.
+
+    A way is split where a node is missing from the dataset or lies outside
+    the boundary, and pieces too short to draw a line are dropped.
+    """
+
+    pieces = []
+    for path in paths:
+        piece = []
+        for node_id in chain(path, [None]):
+            if node_id in nodes and (inside is None or node_id in inside):
+                piece.append(nodes[node_id])
+                continue
+            if len(piece) > 1:
+                pieces.append(np.array(piece))
+            piece = []
+    return pieces
+
+
+def process_city_data(
+    city: str,
+    settings: dict,
+    seen: dict[str, set[int]] | None = None,
+    polylines: list[dict] | None = None,
+    data: dict | None = None,
+) -> list[list]:
+    """Return the short-street nodes that should appear for one city.
+
+    Combined builds pass the same ``seen`` mapping of ``"node"`` and ``"way"``
+    id sets to every city.  Streets are always measured over every way in the
+    dataset, but a node or way that an earlier city emitted is not emitted
+    again, so overlapping datasets draw each element once.  When
+    ``polylines`` is given, the way geometry of every street with at least
+    one emitted node is appended to it for the street renderer.  ``data`` is
+    the parsed dataset when the caller has already loaded it.
+    """
 
     print(f"Processing {city}...")
-    data = load_city_data(city)
+    if data is None:
+        data = load_city_data(city)
     nodes = node_dictionary(data)
     streets = street_dictionary(data)
 
+    # Nodes outside the city boundary can never count toward it, so drop
+    # them, and streets with no node inside, before any expensive step.
+    boundary = load_boundary(city) if settings["heat_map_clip_to_boundary"] else None
+    inside = None
+    if boundary:
+        inside = boundary.contains_nodes(nodes)
+        streets = {
+            name: paths
+            for name, paths in streets.items()
+            if not inside.isdisjoint(chain.from_iterable(paths))
+        }
+        print(f"  ✓ Boundary: {len(inside):,} of {len(nodes):,} OSM nodes inside")
+
     lengths_by_node = {}
-    for paths in streets.values():
-        length = total_distance_km(paths, nodes)
+    street_by_node = {}
+    street_lengths = {}
+    for name, paths in streets.items():
+        length = street_lengths[name] = total_distance_km(paths, nodes)
         for node_id in set(chain.from_iterable(paths)):
             lengths_by_node[node_id] = length
+            street_by_node[node_id] = name
 
     citystrides_file = find_citystrides_file(city)
     citystrides_points = {}
+    citystrides_ids = {}
     if citystrides_file:
-        citystrides_points = load_citystrides_points(citystrides_file)
+        citystrides_points = load_citystrides_points(citystrides_file, citystrides_ids)
         print(f"  ✓ CityStrides targets: {citystrides_file.relative_to(ROOT)}")
+        covered_file = covered_targets_file(citystrides_file)
+        if covered_file.exists():
+            print(f"  ℹ Skipping targets in {covered_file.relative_to(ROOT)}")
+        if citystrides_ids and not ids_match_osm(citystrides_ids, nodes):
+            citystrides_ids = {}
     else:
         print("  ℹ No CityStrides target CSV found")
 
-    max_length = float(settings["heat_map_max_length"])
+    max_length = length_ceiling(settings)
     filter_to_citystrides = bool(settings["heat_map_exclude_csnodes"])
     rows = []
+    duplicates = 0
+    matches = {"id": 0, "spatial": 0, "unmatched": 0}
 
     for element in tqdm(data["elements"], desc=f"  Selecting {city} nodes"):
         if element["type"] != "node" or element["id"] not in lengths_by_node:
             continue
+        if inside is not None and element["id"] not in inside:
+            continue
+        if seen is not None and element["id"] in seen["node"]:
+            duplicates += 1
+            continue
 
         length = lengths_by_node[element["id"]]
         if length >= max_length:
             continue
 
         point = float(element["lat"]), float(element["lon"])
-        if (
-            filter_to_citystrides
-            and citystrides_file
-            and not is_close_to_citystrides_node(citystrides_points, point)
-        ):
-            continue
+        if filter_to_citystrides and citystrides_file:
+            if element["id"] in citystrides_ids:
+                matches["id"] += 1
+            elif is_close_to_citystrides_node(citystrides_points, point):
+                matches["spatial"] += 1
+            else:
+                matches["unmatched"] += 1
+                continue
 
         rows.append(
-            [point[0], point[1], 2, f"Name: {element['id']} ({city})", length]
+            [
+                point[0],
+                point[1],
+                2,
+                f"Name: {element['id']} ({city})",
+                length,
+                street_by_node[element["id"]],
+            ]
         )
+        if seen is not None:
+            seen["node"].add(element["id"])
+
+    if polylines is not None:
+        emitted = dict.fromkeys(row[5] for row in rows)
+        ways = defaultdict(list)
+        for element in data["elements"]:
+            name = element.get("tags", {}).get("name", "unnamed")
+            if element["type"] == "way" and name in emitted:
+                ways[name].append(element)
+        for name in emitted:
+            paths = []
+            for way in ways[name]:
+                if seen is not None and way["id"] in seen["way"]:
+                    continue
+                pieces = street_paths([way["nodes"]], nodes, inside)
+                if pieces and seen is not None:
+                    seen["way"].add(way["id"])
+                paths += pieces
+            if paths:
+                polylines.append(
+                    {
+                        "street": name,
+                        "city": city,
+                        "length": street_lengths[name],
+                        "paths": paths,
+                    }
+                )
 
     print(
         f"  ✓ {len(streets):,} streets, {len(nodes):,} OSM nodes, "
         f"{len(rows):,} heat-map nodes"
     )
+    if filter_to_citystrides and citystrides_file:
+        print(
+            f"  ✓ CityStrides matches: {matches['id']:,} by node id, "
+            f"{matches['spatial']:,} by distance, {matches['unmatched']:,} unmatched"
+        )
+    if duplicates:
+        print(f"  ℹ Skipped {duplicates:,} nodes already emitted by an earlier city")
     return rows
 
 
@@ -190,12 +405,14 @@ def write_nodes_csv(rows: list[list], path: Path) -> pd.DataFrame:
 
 
 def original_data_json(frame: pd.DataFrame) -> str:
-    data = {
-        column: json.loads(frame[column].to_json(orient="values"))
-        for column in NODE_COLUMNS
-    }
+    # pandas already emits each column as a JSON array; join them directly
+    # rather than decoding and re-encoding every value.
+    data = ",".join(
+        f'"{column}":{frame[column].to_json(orient="values")}'
+        for column in PAGE_COLUMNS
+    )
     # Prevent a malicious or unusual OSM name from closing the script element.
-    return json.dumps(data, ensure_ascii=False).replace("<", "\\u003c")
+    return f"{{{data}}}".replace("<", "\\u003c")
 
 
 CUSTOM_PAGE = """
@@ -249,31 +466,26 @@ CUSTOM_PAGE = """
             Plotly.Plots.resize(plot);
         });
     });
+</script>
+"""
 
+LENGTH_FILTER = """
+<script>
     document.addEventListener('DOMContentLoaded', function() {
         setTimeout(filterByLength, 500);
     });
 
     function filterByLength() {
-        const maxLength = parseFloat(document.getElementById('maxLengthFilter').value);
-        const filtered = {lat: [], lon: [], size: [], color: [], hovertext: []};
-
-        for (let i = 0; i < window.originalData.lat.length; i++) {
-            if (window.originalData.len_cat[i] <= maxLength) {
-                filtered.lat.push(window.originalData.lat[i]);
-                filtered.lon.push(window.originalData.lon[i]);
-                filtered.size.push(window.originalData.sz[i]);
-                filtered.color.push(window.originalData.len_cat[i]);
-                filtered.hovertext.push(window.originalData.names[i]);
-            }
-        }
+        // Nodes are sorted by street length, so each threshold is a prefix.
+        const end = window.thresholdEnds[document.getElementById('maxLengthFilter').value];
+        const data = window.originalData;
 
         Plotly.restyle('heat-map-div', {
-            lat: [filtered.lat],
-            lon: [filtered.lon],
-            'marker.size': [filtered.size],
-            'marker.color': [filtered.color],
-            hovertext: [filtered.hovertext]
+            lat: [data.lat.slice(0, end)],
+            lon: [data.lon.slice(0, end)],
+            'marker.size': [data.sz.slice(0, end)],
+            'marker.color': [data.len_cat.slice(0, end)],
+            hovertext: [data.names.slice(0, end)]
         }, 0);
     }
 </script>
@@ -283,19 +495,299 @@ CONTROLS = """
 <div class="controls-info">
     <strong>🗺️ Interactive Heat Map Controls</strong> | Max Street Length:
     <select id="maxLengthFilter" onchange="filterByLength()" style="padding: 4px 8px; border-radius: 4px; border: 1px solid #ccc; margin-left: 8px;">
-        <option value="0.5" selected>0.5 km</option>
-        <option value="1">1.0 km</option>
-        <option value="2">2.0 km</option>
+{options}
     </select>
 </div>
 """
 
 
-def write_heat_map_html(frame: pd.DataFrame, map_style: str, output: Path) -> None:
-    if frame.empty:
-        raise ValueError("No nodes matched the configured heat-map filters")
+def length_controls(thresholds: list[float]) -> str:
+    """The filter bar, with the shortest threshold selected."""
+
+    options = []
+    for threshold in thresholds:
+        label = f"{threshold:.1f}" if round(threshold, 1) == threshold else f"{threshold:g}"
+        selected = " selected" if threshold == thresholds[0] else ""
+        options.append(f'        <option value="{threshold:g}"{selected}>{label} km</option>')
+    return CONTROLS.format(options="\n".join(options))
+
+
+def threshold_ends(frame: pd.DataFrame, thresholds: list[float]) -> dict[str, int]:
+    """Number of leading rows of a length-sorted frame below each threshold."""
+
+    ends = np.searchsorted(frame["len_cat"].to_numpy(), thresholds, side="left")
+    return {f"{threshold:g}": int(end) for threshold, end in zip(thresholds, ends, strict=True)}
+
+
+RASTER_CONTROLS = """
+<div class="controls-info">
+    <strong>🗺️ Interactive Heat Map</strong> | Short-street density on a
+    {cell_km:g} km grid, weighted by inverse street length
+</div>
+"""
+
+# Streets shorter than this are weighted as if they were this long so that a
+# single-node street does not swamp its whole raster cell.
+MIN_RASTER_LENGTH_KM = 0.01
+
+
+def raster_frame(frame: pd.DataFrame, cell_km: float) -> pd.DataFrame:
+    """Bin nodes into a lat/lon grid weighted by inverse street length.
+
+    The result has one row per occupied cell, so its size is bounded by the
+    grid resolution rather than by the number of nodes.
+    """
+
+    lat = frame["lat"].to_numpy()
+    lon = frame["lon"].to_numpy()
+    lat_step = cell_km / 111
+    lon_step = lat_step / max(0.01, np.cos(np.radians(lat.mean())))
+    rows = ((lat - lat.min()) // lat_step).astype(np.int64)
+    columns = ((lon - lon.min()) // lon_step).astype(np.int64)
+    cells = rows * (columns.max() + 1) + columns
+
+    weights = 1 / np.maximum(frame["len_cat"].to_numpy(), MIN_RASTER_LENGTH_KM)
+    occupied, inverse = np.unique(cells, return_inverse=True)
+    occupied_rows, occupied_columns = np.divmod(occupied, columns.max() + 1)
+    return pd.DataFrame(
+        {
+            "lat": lat.min() + (occupied_rows + 0.5) * lat_step,
+            "lon": lon.min() + (occupied_columns + 0.5) * lon_step,
+            "weight": np.bincount(inverse, weights=weights),
+            "nodes": np.bincount(inverse),
+        }
+    )
+
+
+def raster_figure(frame: pd.DataFrame, map_style: str, cell_km: float) -> go.Figure:
+    cells = raster_frame(frame, cell_km)
+    figure = go.Figure(
+        go.Densitymap(
+            lat=cells["lat"],
+            lon=cells["lon"],
+            z=cells["weight"],
+            radius=10,
+            customdata=cells["nodes"],
+            hovertemplate=(
+                "%{customdata} short-street nodes<br>"
+                "weight %{z:.1f}<extra></extra>"
+            ),
+            colorbar={"title": {"text": "density"}},
+        )
+    )
+    figure.update_layout(
+        map={
+            "style": map_style,
+            "zoom": 10,
+            "center": {"lat": frame["lat"].mean(), "lon": frame["lon"].mean()},
+        }
+    )
+    return figure
+
+
+STREET_CONTROLS = """
+<div class="controls-info">
+    <strong>🗺️ Interactive Heat Map</strong> | Short streets coloured by total
+    length; click a legend entry to hide a length range
+</div>
+"""
+
+# Streets are drawn as one line trace per length range, since a map line
+# trace has a single colour.
+STREET_LENGTH_BINS = 8
+
+
+def simplify_polyline(points: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """Douglas-Peucker simplification of ``(lat, lon)`` points.
+
+    Each step measures every point of a span against its chord in one numpy
+    operation, on a local equirectangular projection in metres.
+    """
+
+    if len(points) < 3 or tolerance_m <= 0:
+        return points
+    y = points[:, 0] * 111_000
+    x = points[:, 1] * 111_000 * np.cos(np.radians(points[:, 0].mean()))
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    spans = [(0, len(points) - 1)]
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        ox, oy = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        chord = np.hypot(dx, dy)
+        if chord:
+            distances = np.abs(dx * oy - dy * ox) / chord
+        else:
+            distances = np.hypot(ox, oy)
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance_m:
+            split = first + 1 + farthest
+            keep[split] = True
+            spans += [(first, split), (split, last)]
+    return points[keep]
+
+
+def simplify_polylines(polylines: list[dict], tolerance_m: float) -> list[dict]:
+    return [
+        polyline
+        | {"paths": [simplify_polyline(path, tolerance_m) for path in polyline["paths"]]}
+        for polyline in polylines
+    ]
+
+
+def vertex_count(polylines: list[dict]) -> int:
+    return sum(len(path) for polyline in polylines for path in polyline["paths"])
+
+
+def street_traces(polylines: list[dict]) -> list[go.Scattermap]:
+    """Line traces that colour each street by its total length.
+
+    Streets in the same length range share a trace, with ``None`` between
+    ways so that plotly.js does not join them.
+    """
+
+    longest = max((polyline["length"] for polyline in polylines), default=0) or 1
+    step = longest / STREET_LENGTH_BINS
+    groups = defaultdict(list)
+    for polyline in polylines:
+        groups[min(int(polyline["length"] / step), STREET_LENGTH_BINS - 1)].append(polyline)
+
+    colors = sample_colorscale(
+        "Plasma", [(index + 0.5) / STREET_LENGTH_BINS for index in range(STREET_LENGTH_BINS)]
+    )
+    traces = []
+    for index, group in sorted(groups.items()):
+        lat, lon, text = [], [], []
+        for polyline in group:
+            label = f"{polyline['street']} ({polyline['city']})<br>{polyline['length']:.2f} km"
+            for path in polyline["paths"]:
+                lat += [*np.round(path[:, 0], 6).tolist(), None]
+                lon += [*np.round(path[:, 1], 6).tolist(), None]
+                text += [label] * len(path) + [None]
+        traces.append(
+            go.Scattermap(
+                lat=lat,
+                lon=lon,
+                mode="lines",
+                line={"width": 3, "color": colors[index]},
+                text=text,
+                hoverinfo="text",
+                name=f"{index * step:.2f}–{(index + 1) * step:.2f} km",
+            )
+        )
+    return traces
 
-    figure = px.scatter_map(
+
+def street_figure(polylines: list[dict], map_style: str, center: dict[str, float]) -> go.Figure:
+    figure = go.Figure(street_traces(polylines))
+    figure.update_layout(
+        map={"style": map_style, "zoom": 12, "center": center},
+        legend={"title": {"text": "street length"}},
+    )
+    return figure
+
+
+def hotspot_trace(hotspots: pd.DataFrame) -> go.Scattermap:
+    """Numbered overlay markers for ranked hotspots, largest for the best."""
+
+    sizes = 28 - 16 * (hotspots["rank"] - 1) / max(1, len(hotspots) - 1)
+    return go.Scattermap(
+        lat=hotspots["lat"],
+        lon=hotspots["lon"],
+        mode="markers+text",
+        marker={"size": sizes.tolist(), "color": "crimson", "opacity": 0.55},
+        text=hotspots["rank"].astype(str),
+        textfont={"size": 11, "color": "black"},
+        textposition="middle center",
+        name="short-street hotspots",
+        customdata=hotspots[
+            ["rank", "streets", "streets_per_km2", "remaining_km"]
+        ].to_numpy(),
+        hovertemplate=(
+            "<b>Hotspot #%{customdata[0]}</b><br>"
+            "%{customdata[1]} short streets "
+            "(%{customdata[2]:.1f} per km²)<br>"
+            "%{customdata[3]:.2f} km remaining"
+            "<extra></extra>"
+        ),
+    )
+
+
+def write_hotspots_csv(frame: pd.DataFrame, settings: dict, path: Path) -> pd.DataFrame:
+    hotspots = cluster_hotspots(
+        frame,
+        cell_km=float(settings["hotspot_cell_km"]),
+        min_nodes=int(settings["hotspot_min_nodes"]),
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    hotspots.to_csv(path, index=False)
+    return hotspots
+
+
+PAGE_TEMPLATE = """<!doctype html>
+<html>
+<head>
+    <meta charset="utf-8" />
+    <style>html, body {{height: 100%;}}</style>
+{head}
+</head>
+<body>
+{controls}
+    <div style="height:100%; width:100%;">
+        <script charset="utf-8" src="{plotly_url}" integrity="{plotly_integrity}" crossorigin="anonymous"></script>
+        <div id="heat-map-div" class="plotly-graph-div" style="height:100%; width:100%;"></div>
+        <script>
+            Plotly.newPlot("heat-map-div", {data}, {layout}, {config});
+        </script>
+    </div>
+</body>
+</html>
+"""
+
+PLOT_CONFIG = {
+    "displayModeBar": True,
+    "displaylogo": False,
+    "modeBarButtonsToAdd": ["pan2d", "select2d", "lasso2d", "resetScale2d"],
+    "scrollZoom": True,
+    "doubleClick": "reset",
+    "showTips": True,
+    "responsive": True,
+    "toImageButtonOptions": {
+        "format": "png",
+        "filename": "heat_map",
+        "height": 600,
+        "width": 1000,
+        "scale": 2,
+    },
+}
+
+
+@cache
+def plotly_cdn_script() -> tuple[str, str]:
+    """Return the CDN URL and SRI hash of the installed plotly.js version."""
+
+    digest = hashlib.sha256(get_plotlyjs().encode("utf-8")).digest()
+    return (
+        f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js",
+        f"sha256-{base64.b64encode(digest).decode('ascii')}",
+    )
+
+
+def typed_array(values: pd.Series) -> dict:
+    """Encode a numeric column as a plotly.js base64 typed array."""
+
+    dtype = "i4" if pd.api.types.is_integer_dtype(values) else "f8"
+    data = values.to_numpy(dtype=f"<{dtype}")
+    return {"dtype": dtype, "bdata": base64.b64encode(data.tobytes()).decode("ascii")}
+
+
+def scatter_figure(
+    frame: pd.DataFrame, map_style: str, center: dict[str, float]
+) -> go.Figure:
+    return px.scatter_map(
         frame,
         lat="lat",
         lon="lon",
@@ -304,9 +796,12 @@ def write_heat_map_html(frame: pd.DataFrame, map_style: str, output: Path) -> No
         hover_name="names",
         color="len_cat",
         zoom=12,
-        center={"lat": frame["lat"].mean(), "lon": frame["lon"].mean()},
+        center=center,
         map_style=map_style,
     )
+
+
+def style_figure(figure: go.Figure) -> None:
     figure.update_layout(
         margin={"r": 5, "t": 30, "l": 5, "b": 5},
         showlegend=True,
@@ -319,39 +814,342 @@ def write_heat_map_html(frame: pd.DataFrame, map_style: str, output: Path) -> No
             "font": {"size": 16},
         },
     )
-    config = {
-        "displayModeBar": True,
-        "displaylogo": False,
-        "modeBarButtonsToAdd": ["pan2d", "select2d", "lasso2d", "resetScale2d"],
-        "scrollZoom": True,
-        "doubleClick": "reset",
-        "showTips": True,
-        "responsive": True,
-        "toImageButtonOptions": {
-            "format": "png",
-            "filename": "heat_map",
-            "height": 600,
-            "width": 1000,
-            "scale": 2,
-        },
+
+
+def heat_map_figure_json(
+    frame: pd.DataFrame,
+    map_style: str,
+    hotspots: pd.DataFrame | None = None,
+    raster_cell_km: float | None = None,
+    polylines: list[dict] | None = None,
+) -> dict:
+    """Return the plotly ``data`` and ``layout`` for the heat map.
+
+    plotly.express validates every point it is given, which dominates render
+    time for large frames.  The per-node figure is therefore built from the
+    single largest marker, so that plotly computes the same marker scaling,
+    and the node arrays are substituted into its JSON afterwards.
+    """
+
+    center = {"lat": frame["lat"].mean(), "lon": frame["lon"].mean()}
+    if raster_cell_km:
+        figure = raster_figure(frame, map_style, raster_cell_km)
+    elif polylines:
+        figure = street_figure(polylines, map_style, center)
+    else:
+        figure = scatter_figure(frame.loc[[frame["sz"].idxmax()]], map_style, center)
+    style_figure(figure)
+    if hotspots is not None and not hotspots.empty:
+        figure.add_trace(hotspot_trace(hotspots))
+
+    plot = figure.to_plotly_json()
+    if not raster_cell_km and not polylines:
+        nodes = plot["data"][0]
+        nodes["lat"] = typed_array(frame["lat"])
+        nodes["lon"] = typed_array(frame["lon"])
+        nodes["hovertext"] = frame["names"].tolist()
+        nodes["marker"]["size"] = typed_array(frame["sz"])
+        nodes["marker"]["color"] = typed_array(frame["len_cat"])
+    return plot
+
+
+def write_heat_map_html(
+    frame: pd.DataFrame,
+    map_style: str,
+    output: Path,
+    hotspots: pd.DataFrame | None = None,
+    raster_cell_km: float | None = None,
+    polylines: list[dict] | None = None,
+    thresholds: list[float] | None = None,
+    split_assets: bool = False,
+    title: str | None = None,
+) -> None:
+    """Write the heat map page.
+
+    By default every node is its own marker and the page can re-filter them by
+    any of the street-length ``thresholds`` (``DEFAULT_THRESHOLDS`` when not
+    given).  With ``raster_cell_km`` the nodes are pre-binned into a density
+    grid instead, which keeps region-sized maps small and fast.  With
+    ``polylines`` each street is drawn as simplified lines.  ``split_assets``
+    moves the figure and page data into a content-hashed script beside the
+    page and precompresses both.  The page is replaced atomically, so a
+    preview is never seen half-written.
+    """
+
+    if frame.empty:
+        raise ValueError("No nodes matched the configured heat-map filters")
+    if thresholds is None:
+        thresholds = list(DEFAULT_THRESHOLDS)
+
+    if not raster_cell_km and not polylines:
+        # Sorted by length, every threshold of the page filter is a prefix.
+        frame = frame.sort_values("len_cat", kind="stable", ignore_index=True)
+    plot = heat_map_figure_json(frame, map_style, hotspots, raster_cell_km, polylines)
+    if title:
+        plot["layout"]["title"]["text"] = title
+    page_data = ""
+    if raster_cell_km:
+        head = CUSTOM_PAGE
+        controls = RASTER_CONTROLS.format(cell_km=raster_cell_km)
+    elif polylines:
+        head = CUSTOM_PAGE
+        controls = STREET_CONTROLS
+    else:
+        page_data = (
+            f"window.originalData = {original_data_json(frame)};\n"
+            f"window.thresholdEnds = {json.dumps(threshold_ends(frame, thresholds))};"
+        )
+        head = f"{CUSTOM_PAGE}{LENGTH_FILTER}"
+        controls = length_controls(thresholds)
+
+    data = to_json_plotly(plot["data"])
+    layout = to_json_plotly(plot["layout"])
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if split_assets:
+        figure = f'window.heatMapFigure = {{"data": {data}, "layout": {layout}}};'
+        filename = write_asset(
+            output.parent / ASSET_DIR, output.stem, f"{page_data}\n{figure}\n".lstrip()
+        )
+        head = f'{head}\n<script src="{ASSET_DIR}/{filename}"></script>'
+        data, layout = "window.heatMapFigure.data", "window.heatMapFigure.layout"
+    elif page_data:
+        head = f"{head}\n<script>{page_data}</script>"
+
+    plotly_url, plotly_integrity = plotly_cdn_script()
+    html = PAGE_TEMPLATE.format(
+        head=head,
+        controls=controls,
+        plotly_url=plotly_url,
+        plotly_integrity=plotly_integrity,
+        data=data,
+        layout=layout,
+        config=json.dumps(PLOT_CONFIG),
+    )
+    temporary = output.with_name(output.name + ".tmp")
+    temporary.write_text(html, encoding="utf-8")
+    os.replace(temporary, output)
+    if split_assets:
+        precompress(output)
+
+
+def write_heat_map(
+    frame: pd.DataFrame,
+    settings: dict,
+    output: Path,
+    mode: str = "points",
+    hotspots: bool = False,
+    polylines: list[dict] | None = None,
+    split_assets: bool = False,
+    title: str | None = None,
+) -> None:
+    """Write the page of a build's node frame in ``mode``.
+
+    ``points`` pages serve every threshold; the hotspot, raster and street
+    views keep to ``heat_map_max_length``.  With ``hotspots`` the ranked
+    clusters are also written beside the page as ``<page>.hotspots.csv``.
+    """
+
+    max_length = float(settings["heat_map_max_length"])
+    short = frame[frame["len_cat"] < max_length]
+    ranked = None
+    if hotspots:
+        hotspots_output = output.with_suffix(".hotspots.csv")
+        ranked = write_hotspots_csv(short, settings, hotspots_output)
+        print(f"✓ Ranked {len(ranked):,} hotspots in {hotspots_output}")
+    if polylines is not None:
+        vertices = vertex_count(polylines)
+        polylines = simplify_polylines(
+            [polyline for polyline in polylines if polyline["length"] < max_length],
+            float(settings["heat_map_simplify_m"]),
+        )
+        print(f"✓ Simplified {vertices:,} street vertices to {vertex_count(polylines):,}")
+    write_heat_map_html(
+        frame if mode == "points" else short,
+        settings["map_style"],
+        output,
+        ranked,
+        float(settings["heat_map_raster_cell_km"]) if mode == "raster" else None,
+        polylines,
+        length_thresholds(settings),
+        split_assets,
+        title,
+    )
+
+
+# Preview strata are about 0.5 km squares holding at most this many nodes.
+PREVIEW_CELL_DEG = 0.005
+PREVIEW_PER_CELL = 12
+
+
+def stratified_sample(
+    data: dict,
+    cell_deg: float = PREVIEW_CELL_DEG,
+    per_cell: int = PREVIEW_PER_CELL,
+    seed: int = 0,
+) -> tuple[list[dict], int]:
+    """Reservoir-sample node elements per grid cell in one pass.
+
+    Returns the sample and the number of nodes seen.  Every occupied cell
+    keeps up to ``per_cell`` uniformly chosen nodes, so sparse suburbs stay
+    visible next to dense centres.
+    """
+
+    random = Random(seed)
+    reservoirs = defaultdict(list)
+    counts = defaultdict(int)
+    total = 0
+    for element in data["elements"]:
+        if element["type"] != "node":
+            continue
+        total += 1
+        cell = int(element["lat"] // cell_deg), int(element["lon"] // cell_deg)
+        counts[cell] += 1
+        reservoir = reservoirs[cell]
+        if len(reservoir) < per_cell:
+            reservoir.append(element)
+        elif (slot := random.randrange(counts[cell])) < per_cell:
+            reservoir[slot] = element
+    return [element for reservoir in reservoirs.values() for element in reservoir], total
+
+
+def preview_city_rows(
+    city: str, settings: dict, data: dict, polylines: list[dict] | None = None
+) -> tuple[list[list], int, int]:
+    """Heat-map rows for a stratified sample of one city's nodes.
+
+    Only the streets through sampled nodes are measured, and CityStrides
+    targets are matched by coordinate bucket instead of geodesic distance.
+    When ``polylines`` is given, the geometry of every street with a sampled
+    row is appended to it.  Returns the rows, the sample size and the city's
+    node count.
+    """
+
+    sample, total = stratified_sample(data)
+    sampled = {element["id"] for element in sample}
+    streets = {
+        name: paths
+        for name, paths in street_dictionary(data).items()
+        if not sampled.isdisjoint(chain.from_iterable(paths))
     }
+    # Coordinates are only needed for the nodes of the streets measured.
+    wanted = set(chain.from_iterable(chain.from_iterable(streets.values())))
+    nodes = {
+        element["id"]: (float(element["lat"]), float(element["lon"]))
+        for element in data["elements"]
+        if element["type"] == "node" and element["id"] in wanted
+    }
+    boundary = load_boundary(city) if settings["heat_map_clip_to_boundary"] else None
+    inside = boundary.contains_nodes(nodes) if boundary else None
+    if inside is not None:
+        sample = [element for element in sample if element["id"] in inside]
+
+    street_by_node = {}
+    lengths = {}
+    for name, paths in streets.items():
+        lengths[name] = total_distance_km(paths, nodes)
+        street_by_node.update(dict.fromkeys(sampled.intersection(chain.from_iterable(paths)), name))
+
+    citystrides_file = find_citystrides_file(city)
+    buckets = None
+    if settings["heat_map_exclude_csnodes"] and citystrides_file:
+        buckets = load_citystrides_points(citystrides_file)
 
-    html = figure.to_html(
-        include_plotlyjs="cdn", config=config, div_id="heat-map-div"
+    ceiling = length_ceiling(settings)
+    rows = []
+    for element in sample:
+        name = street_by_node.get(element["id"])
+        if name is None or lengths[name] >= ceiling:
+            continue
+        point = nodes[element["id"]]
+        if buckets is not None and point_bucket(point) not in buckets:
+            continue
+        rows.append(
+            [point[0], point[1], 2, f"Name: {element['id']} ({city})", lengths[name], name]
+        )
+
+    if polylines is not None:
+        for name in dict.fromkeys(row[5] for row in rows):
+            polylines.append(
+                {
+                    "street": name,
+                    "city": city,
+                    "length": lengths[name],
+                    "paths": street_paths(streets[name], nodes, inside),
+                }
+            )
+    return rows, len(sample), total
+
+
+def write_preview(
+    cities: list[str],
+    settings: dict,
+    output: Path,
+    mode: str = "points",
+    datasets: dict[str, dict] | None = None,
+) -> None:
+    """Write a sampled map in the build's ``mode`` to ``output``.
+
+    Parsed city datasets are stored in ``datasets`` as they are loaded so the
+    full build that follows does not read them again.
+    """
+
+    started = time.perf_counter()
+    datasets = {} if datasets is None else datasets
+    rows, sampled, total = [], 0, 0
+    polylines = [] if mode == "streets" else None
+    for city in cities:
+        if city not in datasets:
+            datasets[city] = load_city_data(city)
+        city_rows, city_sampled, city_total = preview_city_rows(
+            city, settings, datasets[city], polylines
+        )
+        rows += city_rows
+        sampled += city_sampled
+        total += city_total
+
+    ratio = sampled / max(total, 1)
+    write_heat_map(
+        pd.DataFrame(rows, columns=NODE_COLUMNS),
+        settings,
+        output,
+        mode,
+        polylines=polylines,
+        title=f"City Strides Heat Map (preview: {ratio:.1%} of {total:,} nodes)",
+    )
+    print(
+        f"✓ Preview of {sampled:,} of {total:,} nodes ({ratio:.1%}) in {output} "
+        f"after {time.perf_counter() - started:.1f}s"
     )
-    data_script = f"<script>window.originalData = {original_data_json(frame)};</script>"
-    html = html.replace("</head>", f"{CUSTOM_PAGE}\n{data_script}\n</head>")
-    html = html.replace("<body>", f"<body>\n{CONTROLS}")
 
-    output.parent.mkdir(parents=True, exist_ok=True)
-    output.write_text(html, encoding="utf-8")
+
+def parse_bbox(text: str) -> list[float]:
+    values = [float(value) for value in text.split(",")]
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError("expected SOUTH,WEST,NORTH,EAST")
+    return values
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Create one interactive heat map from one or more cities"
     )
-    parser.add_argument("cities", nargs="+", help="city dataset names")
+    parser.add_argument(
+        "cities",
+        nargs="*",
+        help="city dataset names (with --bbox: limit the area to these cities)",
+    )
+    parser.add_argument(
+        "--bbox",
+        type=parse_bbox,
+        metavar="S,W,N,E",
+        help="map this area from the spatial store instead of whole city files",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=ROOT / "spatial.sqlite",
+        help="spatial store for --bbox (default: spatial.sqlite)",
+    )
     parser.add_argument(
         "--config",
         type=Path,
@@ -369,28 +1167,101 @@ def parse_args() -> argparse.Namespace:
         default=ROOT / "nodes.csv",
         help="intermediate node CSV path (default: nodes.csv)",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--hotspots",
+        action="store_true",
+        help="rank short-street clusters and draw them over the map",
+    )
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument(
+        "--raster",
+        action="store_true",
+        help="draw a density grid instead of one marker per node",
+    )
+    modes.add_argument(
+        "--streets",
+        action="store_true",
+        help="draw each short street as a simplified line instead of its nodes",
+    )
+    parser.add_argument(
+        "--preview",
+        action="store_true",
+        help="write a sampled per-node map first, then replace it with the full map",
+    )
+    parser.add_argument(
+        "--split-assets",
+        action="store_true",
+        help="load the map data from a content-hashed, precompressed script",
+    )
+    args = parser.parse_args()
+    if not args.cities and not args.bbox:
+        parser.error("give at least one city or --bbox")
+    return args
+
+
+def bbox_rows(args: argparse.Namespace, settings: dict, polylines: list[dict] | None) -> list[list]:
+    # Imported here because the store builds on this module's selection logic.
+    import spatial_store
+
+    connection = spatial_store.connect(args.store)
+    try:
+        cities = [normalized_city_name(city) for city in args.cities]
+        return spatial_store.query_rows(connection, args.bbox, settings, cities, polylines)
+    finally:
+        connection.close()
 
 
 def main() -> int:
     args = parse_args()
     cities = [normalized_city_name(city) for city in args.cities]
     missing = [city for city in cities if not (ROOT / "data" / f"{city}.json").exists()]
-    if missing:
+    if missing and not args.bbox:
         print(f"✗ Missing city data: {', '.join(missing)}")
         return 1
 
     try:
         settings = load_settings(args.config)
-        rows = [
-            row
-            for city in cities
-            for row in process_city_data(city, settings)
-        ]
+        # Overlapping datasets share OSM elements; the first city listed wins.
+        seen = {"node": set(), "way": set()} if len(cities) > 1 else None
+        name = "_".join(cities)
+        if args.bbox:
+            name = "area_" + "_".join(f"{value:g}" for value in args.bbox)
+        output = args.output or ROOT / "heat_maps" / f"{name}.html"
+        mode = settings["heat_map_mode"]
+        if args.raster or args.streets:
+            mode = "raster" if args.raster else "streets"
+        datasets = {}
+        if args.preview and args.bbox:
+            print("ℹ --preview is not available with --bbox")
+        elif args.preview:
+            # The preview is best-effort; the full build below still decides
+            # whether the command succeeds.
+            try:
+                write_preview(list(dict.fromkeys(cities)), settings, output, mode, datasets)
+            except (OSError, ValueError, KeyError, json.JSONDecodeError) as error:
+                print(f"ℹ Skipped the preview: {error}")
+        polylines = [] if mode == "streets" else None
+        if args.bbox:
+            rows = bbox_rows(args, settings, polylines)
+        else:
+            rows = [
+                row
+                for city in dict.fromkeys(cities)
+                for row in process_city_data(
+                    city, settings, seen, polylines, datasets.pop(city, None)
+                )
+            ]
         frame = write_nodes_csv(rows, args.nodes_output)
-        output = args.output or ROOT / "heat_maps" / f"{'_'.join(cities)}.html"
-        write_heat_map_html(frame, settings["map_style"], output)
-    except (OSError, ValueError, KeyError, json.JSONDecodeError) as error:
+        write_heat_map(
+            frame,
+            settings,
+            output,
+            mode,
+            args.hotspots or settings["heat_map_hotspots"],
+            polylines,
+            args.split_assets,
+        )
+    except (OSError, ValueError, KeyError, json.JSONDecodeError, sqlite3.Error) as error:
         print(f"✗ Could not create heat map: {error}")
         return 1
 
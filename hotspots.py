@@ -0,0 +1,115 @@
+"""Group selected short-street nodes into ranked hotspots.
+
+The clustering is a grid-hash variant of DBSCAN: nodes are hashed into square
+cells roughly ``cell_km`` wide, cells holding at least ``min_nodes`` nodes are
+dense, and 8-connected dense cells form one hotspot.  Sparse cells touching a
+hotspot join it as border cells, and anything else is noise.  Every step is a
+dictionary lookup per node or per cell, so region-sized inputs take seconds.
+"""
+
+from collections import deque
+from math import cos, radians
+
+import pandas as pd
+
+KM_PER_DEGREE = 111.0
+HOTSPOT_COLUMNS = [
+    "rank",
+    "lat",
+    "lon",
+    "nodes",
+    "streets",
+    "area_km2",
+    "streets_per_km2",
+    "remaining_km",
+    "street_names",
+]
+NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+def grid_cells(frame: pd.DataFrame, cell_km: float) -> pd.Series:
+    """Return the ``(row, column)`` grid cell of every node in ``frame``."""
+
+    lon_km = KM_PER_DEGREE * cos(radians(frame["lat"].mean()))
+    rows = (frame["lat"] * KM_PER_DEGREE // cell_km).astype(int)
+    columns = (frame["lon"] * lon_km // cell_km).astype(int)
+    return pd.Series(list(zip(rows, columns, strict=True)), index=frame.index)
+
+
+def label_cells(counts: dict[tuple[int, int], int], min_nodes: int) -> dict:
+    """Assign a hotspot label to dense cells and the sparse cells bordering them."""
+
+    dense = {cell for cell, count in counts.items() if count >= min_nodes}
+    labels = {}
+    label = -1
+    for seed in sorted(dense):
+        if seed in labels:
+            continue
+        label += 1
+        labels[seed] = label
+        queue = deque([seed])
+        while queue:
+            x, y = queue.popleft()
+            for dx, dy in NEIGHBOURS:
+                cell = x + dx, y + dy
+                if cell in dense and cell not in labels:
+                    labels[cell] = label
+                    queue.append(cell)
+
+    for cell in sorted(set(counts) - dense):
+        x, y = cell
+        touching = [
+            labels[x + dx, y + dy]
+            for dx, dy in NEIGHBOURS
+            if (x + dx, y + dy) in dense
+        ]
+        if touching:
+            labels[cell] = min(touching)
+    return labels
+
+
+def cluster_hotspots(
+    frame: pd.DataFrame, cell_km: float = 0.25, min_nodes: int = 8
+) -> pd.DataFrame:
+    """Return hotspots ranked by distinct short streets per square kilometre.
+
+    ``frame`` uses the heat-map node columns.  Streets are identified by their
+    name and length so that equally named streets elsewhere are not merged.
+    """
+
+    if frame.empty:
+        return pd.DataFrame(columns=HOTSPOT_COLUMNS)
+
+    cells = grid_cells(frame, cell_km)
+    labels = label_cells(cells.value_counts().to_dict(), min_nodes)
+    clustered = frame.assign(
+        cell=cells, hotspot=cells.map(lambda cell: labels.get(cell, -1))
+    )
+    clustered = clustered[clustered["hotspot"] >= 0]
+    if clustered.empty:
+        return pd.DataFrame(columns=HOTSPOT_COLUMNS)
+
+    hotspots = []
+    for _, group in clustered.groupby("hotspot", sort=True):
+        streets = group.drop_duplicates(subset=["street", "len_cat"])
+        area = group["cell"].nunique() * cell_km * cell_km
+        hotspots.append(
+            {
+                "lat": group["lat"].mean(),
+                "lon": group["lon"].mean(),
+                "nodes": len(group),
+                "streets": len(streets),
+                "area_km2": area,
+                "streets_per_km2": len(streets) / area,
+                "remaining_km": streets["len_cat"].sum(),
+                "street_names": "; ".join(sorted(streets["street"].astype(str))),
+            }
+        )
+
+    ranked = pd.DataFrame(hotspots).sort_values(
+        ["streets_per_km2", "remaining_km", "lat", "lon"],
+        ascending=[False, False, True, True],
+        ignore_index=True,
+    )
+    ranked.insert(0, "rank", range(1, len(ranked) + 1))
+    return ranked[HOTSPOT_COLUMNS]
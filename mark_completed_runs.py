@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+"""Mark CityStrides targets covered by completed runs without re-downloading.
+
+Every page in ``past_runs/`` embeds its route in a ``routeData`` script and
+``past_runs/completed.json`` records when it was run.  Each route is buffered
+by a GPS tolerance and joined against ``csnodes/<city>.csv`` through a grid
+index.  The targets within the buffer are written to ``csnodes/<city>.covered.csv``,
+which the heat map skips, so the to-do set is current right after a run.
+
+Only runs completed after the csnodes download (its ``meta.json``
+``generated_at``) are used, since older runs are already reflected in it.
+"""
+
+import argparse
+import csv
+import json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import build_run_index as runs
+import create_heat_map as heat_map
+
+ROOT = Path(__file__).resolve().parent
+METRES_PER_DEGREE = 111_000
+COVERED_COLUMNS = ["lat", "lon", "node_id", "run", "completed_at"]
+
+
+def parse_time(timestamp: str) -> datetime:
+    # Timestamps without an offset were written in local time.
+    return datetime.fromisoformat(timestamp).astimezone()
+
+
+def completed_routes() -> list[dict]:
+    """Routes of the completed runs, with their completion times."""
+
+    routes = []
+    for filename, timestamp in runs.load_completed().items():
+        path = runs.PAST_DIR / filename
+        if not path.exists():
+            continue
+        match = runs.ROUTE_DATA.search(path.read_text(encoding="utf-8"))
+        if not match:
+            raise ValueError(f"{filename} has no routeData script")
+        route = np.array(json.loads(match.group(1)).get("route", []), dtype=float)
+        if len(route) < 2:
+            continue
+        routes.append(
+            {
+                "run": filename,
+                "completed_at": parse_time(timestamp),
+                "route": route.reshape(-1, 2),
+            }
+        )
+    return routes
+
+
+def read_targets(path: Path) -> tuple[np.ndarray, list[str]]:
+    """``(lat, lon)`` points and node ids (blank if absent) of a csnodes file."""
+
+    with path.open(newline="", encoding="utf-8") as handle:
+        rows = list(csv.DictReader(handle))
+    points = np.array(
+        [(float(row["lat"]), float(row["lon"])) for row in rows], dtype=float
+    ).reshape(-1, 2)
+    return points, [row.get("node_id", "") for row in rows]
+
+
+def download_time(path: Path) -> datetime | None:
+    meta = path.with_name(f"{path.stem}.meta.json")
+    if not meta.exists():
+        return None
+    with meta.open(encoding="utf-8") as handle:
+        generated_at = json.load(handle).get("generated_at")
+    return parse_time(generated_at) if generated_at else None
+
+
+class TargetIndex:
+    """csnodes points bucketed into square cells one tolerance wide.
+
+    Points are projected to metres around the city's mean latitude, so a
+    route segment only has to be measured against the points in the cells
+    its tolerance-expanded bounding box touches.
+    """
+
+    def __init__(self, points: np.ndarray, tolerance_m: float):
+        self.tolerance = tolerance_m
+        self.scale = np.array(
+            [METRES_PER_DEGREE, METRES_PER_DEGREE * np.cos(np.radians(points[:, 0].mean()))]
+        )
+        self.xy = points * self.scale
+        keys = np.floor(self.xy / tolerance_m).astype(np.int64)
+        order = np.lexsort((keys[:, 1], keys[:, 0]))
+        unique, starts = np.unique(keys[order], axis=0, return_index=True)
+        self.cells = {
+            (int(row), int(column)): indices
+            for (row, column), indices in zip(
+                unique, np.split(order, starts[1:]), strict=True
+            )
+        }
+
+    def covered(self, route: np.ndarray) -> np.ndarray:
+        """Boolean mask of the points within the tolerance of a route."""
+
+        mask = np.zeros(len(self.xy), dtype=bool)
+        path = route * self.scale
+        for start, end in zip(path[:-1], path[1:], strict=True):
+            low = np.floor((np.minimum(start, end) - self.tolerance) / self.tolerance)
+            high = np.floor((np.maximum(start, end) + self.tolerance) / self.tolerance)
+            candidates = [
+                self.cells[key]
+                for row in range(int(low[0]), int(high[0]) + 1)
+                for column in range(int(low[1]), int(high[1]) + 1)
+                if (key := (row, column)) in self.cells
+            ]
+            if not candidates:
+                continue
+            indices = np.concatenate(candidates)
+            segment = end - start
+            length = segment @ segment
+            offsets = self.xy[indices] - start
+            along = np.clip(offsets @ segment / length, 0, 1) if length else 0
+            distances = np.hypot(*(offsets - np.multiply.outer(along, segment)).T)
+            mask[indices[distances <= self.tolerance]] = True
+        return mask
+
+
+def route_near(route: np.ndarray, bbox: np.ndarray, margin: float) -> bool:
+    south, west = route.min(axis=0) - margin
+    north, east = route.max(axis=0) + margin
+    return south <= bbox[2] and north >= bbox[0] and west <= bbox[3] and east >= bbox[1]
+
+
+def mark_city(
+    csnodes: Path, routes: list[dict], tolerance_m: float, use_all: bool = False
+) -> tuple[int, int, list[str]]:
+    """Write the city's covered targets and return counts and the runs used."""
+
+    points, node_ids = read_targets(csnodes)
+    since = None if use_all else download_time(csnodes)
+    margin = tolerance_m / METRES_PER_DEGREE * 2
+    bbox = np.concatenate([points.min(axis=0), points.max(axis=0)]) if len(points) else None
+    selected = [
+        route
+        for route in routes
+        if bbox is not None
+        and (since is None or route["completed_at"] > since)
+        and route_near(route["route"], bbox, margin)
+    ]
+
+    covered_by = {}
+    if selected:
+        index = TargetIndex(points, tolerance_m)
+        for route in sorted(selected, key=lambda route: route["completed_at"]):
+            for position in np.flatnonzero(index.covered(route["route"])):
+                covered_by.setdefault(int(position), route)
+
+    path = heat_map.covered_targets_file(csnodes)
+    if not covered_by:
+        path.unlink(missing_ok=True)
+        return 0, len(points), [route["run"] for route in selected]
+
+    with path.open("w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(COVERED_COLUMNS)
+        for position, route in sorted(covered_by.items()):
+            writer.writerow(
+                [
+                    *points[position].tolist(),
+                    node_ids[position],
+                    route["run"],
+                    route["completed_at"].isoformat(),
+                ]
+            )
+    return len(covered_by), len(points), [route["run"] for route in selected]
+
+
+def rebuild_heat_map(city: str, settings: dict) -> Path | None:
+    """Regenerate an existing ``heat_maps/<city>.html`` in the configured mode.
+
+    Returns ``None`` when there is no page or dataset to rebuild, or when no
+    short-street targets remain, in which case the page is left alone.
+    """
+
+    output = ROOT / "heat_maps" / f"{city}.html"
+    if not output.exists() or not (ROOT / "data" / f"{city}.json").exists():
+        return None
+    mode = settings["heat_map_mode"]
+    polylines = [] if mode == "streets" else None
+    rows = heat_map.process_city_data(city, settings, polylines=polylines)
+    if not rows:
+        print(f"ℹ {city}: no short-street targets remain; kept {output.relative_to(ROOT)}")
+        return None
+    heat_map.write_heat_map(
+        pd.DataFrame(rows, columns=heat_map.NODE_COLUMNS),
+        settings,
+        output,
+        mode,
+        bool(settings["heat_map_hotspots"]),
+        polylines,
+    )
+    return output
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Mark CityStrides targets covered by completed runs"
+    )
+    parser.add_argument(
+        "cities",
+        nargs="*",
+        help="csnodes cities to update (default: the cities of the completed runs)",
+    )
+    parser.add_argument(
+        "--tolerance-m",
+        type=float,
+        default=25.0,
+        help="GPS buffer around each route in metres (default: 25)",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="also use runs completed before the csnodes download",
+    )
+    parser.add_argument(
+        "--heat-maps",
+        action="store_true",
+        help="regenerate existing heat_maps/<city>.html pages afterwards",
+    )
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=ROOT / "parameters.yaml",
+        help="heat-map YAML settings for --heat-maps (default: parameters.yaml)",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        routes = completed_routes()
+        cities = [heat_map.normalized_city_name(city) for city in args.cities] or sorted(
+            {route["run"].split("-", 1)[0] for route in routes}
+        )
+
+        updated = []
+        for city in cities:
+            csnodes = heat_map.find_citystrides_file(city)
+            if not csnodes:
+                print(f"ℹ {city}: no CityStrides targets in csnodes/")
+                continue
+            covered, total, used = mark_city(csnodes, routes, args.tolerance_m, args.all)
+            if not used:
+                print(f"ℹ {city}: no completed runs since the last download")
+                continue
+            print(
+                f"✓ {city}: {covered:,} of {total:,} targets covered by "
+                f"{len(used)} runs"
+            )
+            updated.append(city)
+
+        if args.heat_maps:
+            settings = heat_map.load_settings(args.config)
+            for city in updated:
+                output = rebuild_heat_map(city, settings)
+                if output:
+                    print(f"✓ Rebuilt {output.relative_to(ROOT)}")
+    except (OSError, ValueError, KeyError, json.JSONDecodeError) as error:
+        print(f"✗ Could not mark completed runs: {error}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
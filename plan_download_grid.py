@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+"""Plan the CityStrides node download grid from a city's boundary and density.
+
+The node downloader walks a fixed grid of 0.012° cells, and ``cache/<city>.csv``
+records the cells of that grid (``nelng, nelat, swlng, swlat``) in which it
+found no nodes, so later downloads skip them.  This planner covers the city
+with large cells, drops empty ones outside its boundary polygon (or, without
+a boundary, every cell where no node was seen), and splits a cell in two or
+four whenever the previous download found more nodes in it than one request
+should return.  Sparse areas therefore stay merged in large cells and dense
+areas get small ones.
+"""
+
+import argparse
+import csv
+from pathlib import Path
+
+import numpy as np
+
+from boundaries import Boundary, load_boundary
+
+ROOT = Path(__file__).resolve().parent
+# The cell size used by the existing cache files, in degrees.
+CACHE_CELL = 0.012
+
+
+def read_grid(path: Path) -> list[tuple[float, float, float, float]]:
+    with path.open(newline="", encoding="utf-8") as handle:
+        return [tuple(map(float, row)) for row in csv.reader(handle) if row]
+
+
+def write_grid(cells: list[tuple[float, float, float, float]], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        for cell in cells:
+            writer.writerow([round(value, 7) for value in cell])
+
+
+def read_node_points(path: Path) -> tuple[np.ndarray, np.ndarray]:
+    """Distinct ``(lat, lon)`` positions from a csnodes file."""
+
+    with path.open(newline="", encoding="utf-8") as handle:
+        points = {
+            (float(row[0]), float(row[1]))
+            for row in csv.reader(handle)
+            if row and row[0] != "lat"
+        }
+    array = np.array(sorted(points), dtype=float).reshape(-1, 2)
+    return array[:, 0], array[:, 1]
+
+
+def touches_boundary(boundary: Boundary, cell: tuple[float, float, float, float]) -> bool:
+    """Whether a cell overlaps the boundary.
+
+    Either the cell lies inside the boundary, which its centre shows, or a
+    boundary edge crosses the cell: the edge's bounding box meets the cell and
+    the cell's corners are not all on one side of the edge.
+    """
+
+    nelng, nelat, swlng, swlat = cell
+    if boundary.contains([(swlat + nelat) / 2], [(swlng + nelng) / 2])[0]:
+        return True
+    x1, y1, x2, y2 = boundary.edges.T
+    near = (
+        (np.minimum(x1, x2) <= nelng) & (np.maximum(x1, x2) >= swlng)
+        & (np.minimum(y1, y2) <= nelat) & (np.maximum(y1, y2) >= swlat)
+    )
+    x1, y1, x2, y2 = x1[near], y1[near], x2[near], y2[near]
+    sides = np.array(
+        [
+            (x2 - x1) * (lat - y1) - (y2 - y1) * (lng - x1)
+            for lng, lat in ((swlng, swlat), (swlng, nelat), (nelng, swlat), (nelng, nelat))
+        ]
+    ).reshape(4, -1)
+    return bool(((sides.min(axis=0) <= 0) & (sides.max(axis=0) >= 0)).any())
+
+
+def plan_grid(
+    extent: tuple[float, float, float, float],
+    lat: np.ndarray,
+    lon: np.ndarray,
+    boundary: Boundary | None,
+    budget: int,
+    min_cell: float,
+    max_cell: float,
+) -> list[tuple[float, float, float, float]]:
+    """Return quadtree leaf cells covering ``extent`` (``south, west, north, east``)."""
+
+    south, west, north, east = extent
+    cells = []
+    # Without a boundary, the known nodes are the only sign of the city.
+    keep_empty = boundary is not None or not len(lat)
+
+    def fits(side: np.ndarray) -> bool:
+        return np.count_nonzero(side) <= budget
+
+    def visit(cell, members: np.ndarray) -> None:
+        nelng, nelat, swlng, swlat = cell
+        if not len(members):
+            if not keep_empty or (boundary and not touches_boundary(boundary, cell)):
+                return
+        if len(members) <= budget or nelat - swlat <= min_cell:
+            cells.append(cell)
+            return
+        midlat, midlng = (nelat + swlat) / 2, (nelng + swlng) / 2
+        north_half = lat[members] >= midlat
+        east_half = lon[members] >= midlng
+        lat_halves = ((north_half, (nelat, midlat)), (~north_half, (midlat, swlat)))
+        lng_halves = ((east_half, (nelng, midlng)), (~east_half, (midlng, swlng)))
+
+        # Split along the axis with more halves that fit: a half that fits
+        # stays one cell and only the other half is quartered.
+        if sum(fits(side) for side, _ in lat_halves) >= sum(fits(side) for side, _ in lng_halves):
+            for side, (top, bottom) in lat_halves:
+                if fits(side):
+                    visit((nelng, top, swlng, bottom), members[side])
+                    continue
+                for lng_side, (right, left) in lng_halves:
+                    visit((right, top, left, bottom), members[side & lng_side])
+        else:
+            for side, (right, left) in lng_halves:
+                if fits(side):
+                    visit((right, nelat, left, swlat), members[side])
+                    continue
+                for lat_side, (top, bottom) in lat_halves:
+                    visit((right, top, left, bottom), members[side & lat_side])
+
+    rows = int(np.ceil((north - south) / max_cell))
+    columns = int(np.ceil((east - west) / max_cell))
+    row = np.clip(((lat - south) // max_cell).astype(int), 0, rows - 1)
+    column = np.clip(((lon - west) // max_cell).astype(int), 0, columns - 1)
+    within = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+    for r in range(rows):
+        for c in range(columns):
+            swlat, swlng = south + r * max_cell, west + c * max_cell
+            members = np.flatnonzero(within & (row == r) & (column == c))
+            visit((swlng + max_cell, swlat + max_cell, swlng, swlat), members)
+    return cells
+
+
+def estimated_requests(
+    cells: list[tuple[float, float, float, float]],
+    lat: np.ndarray,
+    lon: np.ndarray,
+    budget: int,
+) -> tuple[int, int]:
+    """Requests a grid needs if each cell is re-split until it fits the budget.
+
+    Also returns how many of the known positions no cell covers.
+    """
+
+    total = 0
+    covered = np.zeros(len(lat), dtype=bool)
+    for nelng, nelat, swlng, swlat in cells:
+        inside = (lat >= swlat) & (lat <= nelat) & (lon >= swlng) & (lon <= nelng)
+        covered |= inside
+        total += max(1, -(-np.count_nonzero(inside) // budget))
+    return total, int(np.count_nonzero(~covered))
+
+
+def current_grid(
+    extent: tuple[float, float, float, float],
+    skipped: list[tuple[float, float, float, float]],
+) -> list[tuple[float, float, float, float]]:
+    """The fixed grid the downloader walks today, less the cells it skips.
+
+    The grid is aligned with the ``skipped`` cells when there are any.
+    """
+
+    south, west, north, east = extent
+    if skipped:
+        lat0 = min(cell[3] for cell in skipped)
+        lon0 = min(cell[2] for cell in skipped)
+        south = lat0 - np.ceil((lat0 - south) / CACHE_CELL) * CACHE_CELL
+        west = lon0 - np.ceil((lon0 - west) / CACHE_CELL) * CACHE_CELL
+    # Cells are compared on rounded corners; the CSV keeps seven decimals.
+    known_empty = {(round(cell[3], 6), round(cell[2], 6)) for cell in skipped}
+    rows = int(np.ceil(round((north - south) / CACHE_CELL, 6)))
+    columns = int(np.ceil(round((east - west) / CACHE_CELL, 6)))
+    cells = []
+    for r in range(rows):
+        for c in range(columns):
+            swlat, swlng = south + r * CACHE_CELL, west + c * CACHE_CELL
+            if (round(swlat, 6), round(swlng, 6)) not in known_empty:
+                cells.append((swlng + CACHE_CELL, swlat + CACHE_CELL, swlng, swlat))
+    return cells
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Plan a boundary- and density-aware CityStrides download grid"
+    )
+    parser.add_argument("city", help="city name used by cache/ and csnodes/")
+    parser.add_argument(
+        "--budget",
+        type=int,
+        default=800,
+        help="most previously seen nodes per cell (default: 800, under the 1000-node page limit)",
+    )
+    parser.add_argument(
+        "--min-cell",
+        type=float,
+        default=CACHE_CELL / 4,
+        help=f"smallest cell in degrees (default: {CACHE_CELL / 4})",
+    )
+    parser.add_argument(
+        "--max-cell",
+        type=float,
+        default=CACHE_CELL * 4,
+        help=f"largest cell in degrees (default: {CACHE_CELL * 4})",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="planned grid CSV (default: cache/<city>.planned.csv)",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    city = args.city.lower().replace(" ", "_").replace("-", "_")
+    cache_path = ROOT / "cache" / f"{city}.csv"
+    csnodes_path = ROOT / "csnodes" / f"{city}.csv"
+    boundary = load_boundary(city)
+
+    try:
+        skipped = read_grid(cache_path) if cache_path.exists() else []
+        empty = np.empty(0)
+        lat, lon = read_node_points(csnodes_path) if csnodes_path.exists() else (empty, empty)
+        if boundary:
+            extent = boundary.south, boundary.west, boundary.north, boundary.east
+        elif skipped or len(lat):
+            # The downloader's area spans both its skipped cells and the nodes.
+            extent = (
+                min([cell[3] for cell in skipped] + lat.tolist()),
+                min([cell[2] for cell in skipped] + lon.tolist()),
+                max([cell[1] for cell in skipped] + lat.tolist()),
+                max([cell[0] for cell in skipped] + lon.tolist()),
+            )
+        else:
+            print(f"✗ {city} has no boundary polygon, cache grid or csnodes file")
+            return 1
+
+        cells = plan_grid(
+            extent, lat, lon, boundary, args.budget, args.min_cell, args.max_cell
+        )
+        current = current_grid(extent, skipped)
+        before, _ = estimated_requests(current, lat, lon, args.budget)
+        after, missed = estimated_requests(cells, lat, lon, args.budget)
+        fallback = after >= before
+        if fallback:
+            cells = current
+            after, missed = estimated_requests(cells, lat, lon, args.budget)
+        output = args.output or ROOT / "cache" / f"{city}.planned.csv"
+        write_grid(cells, output)
+    except (OSError, ValueError, IndexError) as error:
+        print(f"✗ Could not plan the {city} grid: {error}")
+        return 1
+
+    print(f"✓ {len(lat):,} known node positions, boundary {'used' if boundary else 'not found'}")
+    if fallback:
+        print("ℹ The plan does not beat the current grid; writing the current grid")
+    print(f"✓ Planned {len(cells):,} cells in {output}")
+    print(
+        f"  {CACHE_CELL}° grid less {len(skipped):,} empty cells: about {before:,} requests; "
+        f"planned: about {after:,} requests ({before - after:,} saved)"
+    )
+    if missed:
+        print(f"ℹ {missed:,} known positions lie outside the planned cells")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,8 +4,22 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
+from boundaries import load_boundary
+
 cities = pd.read_csv("nodes.csv")
 
+# Newer downloads record each node's city. Where that city has a stored
+# boundary polygon, drop the nodes that fall outside it.
+if "source_city" in cities.columns:
+    inside = pd.Series(True, index=cities.index)
+    for source, rows in cities.groupby("source_city").groups.items():
+        boundary = load_boundary(str(source).lower().replace(" ", "_").replace("-", "_"))
+        if boundary:
+            inside[rows] = boundary.contains(
+                cities.loc[rows, "lat"], cities.loc[rows, "lon"]
+            )
+    cities = cities[inside].reset_index(drop=True)
+
 # Calculate center point for better initial view
 center_lat = cities["lat"].mean()
 center_lon = cities["lon"].mean()
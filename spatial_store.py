@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+
+"""A cross-city SQLite store of street nodes and CityStrides targets.
+
+Each ingested city contributes its street nodes, ways and street lengths from
+``data/<city>.json`` and its remaining targets from ``csnodes/``.  Nodes and
+targets are indexed by an R*Tree, so ``create_heat_map.py --bbox`` reads only
+what intersects an area, however many city files it spans.
+
+``./spatial_store.py`` bulk loads every city; naming cities upserts just
+those.  A city is reloaded only when its dataset, target, covered-target or
+boundary file has changed since it was stored.
+"""
+
+import argparse
+import json
+import sqlite3
+from collections import defaultdict
+from itertools import chain
+from pathlib import Path
+
+import create_heat_map as heat_map
+from boundaries import boundary_path, load_boundary
+
+ROOT = heat_map.ROOT
+STORE = ROOT / "spatial.sqlite"
+# Targets are matched within their 0.001° bucket, so the target query reaches
+# one bucket beyond the requested area.
+TARGET_MARGIN_DEG = 0.001
+# Node ids bound per query, under SQLite's oldest limit of 999 parameters.
+ID_CHUNK = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cities (
+    name TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    has_targets INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS streets (
+    id INTEGER PRIMARY KEY,
+    city TEXT NOT NULL,
+    name TEXT NOT NULL,
+    length_km REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ways (
+    id INTEGER PRIMARY KEY,
+    city TEXT NOT NULL,
+    osm_id INTEGER NOT NULL,
+    street INTEGER NOT NULL,
+    nodes TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    city TEXT NOT NULL,
+    osm_id INTEGER NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    street INTEGER NOT NULL,
+    inside INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS targets (
+    id INTEGER PRIMARY KEY,
+    city TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS target_nodes (
+    city TEXT NOT NULL,
+    osm_id INTEGER NOT NULL,
+    PRIMARY KEY (city, osm_id)
+);
+CREATE INDEX IF NOT EXISTS streets_city ON streets (city);
+CREATE INDEX IF NOT EXISTS ways_street ON ways (street);
+CREATE INDEX IF NOT EXISTS ways_city ON ways (city);
+CREATE INDEX IF NOT EXISTS nodes_osm_id ON nodes (city, osm_id);
+CREATE INDEX IF NOT EXISTS targets_city ON targets (city);
+CREATE VIRTUAL TABLE IF NOT EXISTS node_index USING rtree (id, south, north, west, east);
+CREATE VIRTUAL TABLE IF NOT EXISTS target_index USING rtree (id, south, north, west, east);
+"""
+
+# The R*Tree keeps 32-bit bounds, so exact coordinates are checked again.
+NODES_WITHIN = """
+SELECT nodes.city, nodes.osm_id, nodes.lat, nodes.lon, nodes.inside,
+       streets.id, streets.name, streets.length_km, target_nodes.osm_id IS NOT NULL
+FROM node_index
+JOIN nodes ON nodes.id = node_index.id
+JOIN streets ON streets.id = nodes.street
+LEFT JOIN target_nodes
+  ON target_nodes.city = nodes.city AND target_nodes.osm_id = nodes.osm_id
+WHERE node_index.north >= :south AND node_index.south <= :north
+  AND node_index.east >= :west AND node_index.west <= :east
+  AND nodes.lat BETWEEN :south AND :north AND nodes.lon BETWEEN :west AND :east
+  AND streets.length_km < :ceiling
+ORDER BY nodes.city, nodes.id
+"""
+TARGETS_WITHIN = """
+SELECT targets.city, targets.lat, targets.lon
+FROM target_index
+JOIN targets ON targets.id = target_index.id
+WHERE target_index.north >= :south AND target_index.south <= :north
+  AND target_index.east >= :west AND target_index.west <= :east
+  AND targets.lat BETWEEN :south AND :north AND targets.lon BETWEEN :west AND :east
+"""
+
+
+def connect(path: Path = STORE, create: bool = False) -> sqlite3.Connection:
+    if not create and not path.exists():
+        raise ValueError(f"{path.name} does not exist; run ./spatial_store.py first")
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def source_stamp(city: str) -> str:
+    """Sizes and modification times of every file a city's rows come from."""
+
+    files = [ROOT / "data" / f"{city}.json", boundary_path(city)]
+    citystrides_file = heat_map.find_citystrides_file(city)
+    if citystrides_file:
+        files += [citystrides_file, heat_map.covered_targets_file(citystrides_file)]
+    return json.dumps(
+        [[path.name, path.stat().st_size, path.stat().st_mtime_ns] for path in files if path.exists()]
+    )
+
+
+def delete_city(connection: sqlite3.Connection, city: str) -> None:
+    for table, index in [("nodes", "node_index"), ("targets", "target_index")]:
+        connection.execute(
+            f"DELETE FROM {index} WHERE id IN (SELECT id FROM {table} WHERE city = ?)", (city,)
+        )
+    for table in ["nodes", "targets", "target_nodes", "ways", "streets"]:
+        connection.execute(f"DELETE FROM {table} WHERE city = ?", (city,))
+    connection.execute("DELETE FROM cities WHERE name = ?", (city,))
+
+
+def ingest_city(
+    connection: sqlite3.Connection, city: str, force: bool = False
+) -> dict[str, int] | None:
+    """Replace one city's rows in the store; return counts, or None if current.
+
+    Street lengths and each node's street follow ``process_city_data``.  The
+    boundary test is stored per node rather than applied, so the store does
+    not depend on ``heat_map_clip_to_boundary``.
+    """
+
+    stamp = source_stamp(city)
+    stored = connection.execute("SELECT source FROM cities WHERE name = ?", (city,)).fetchone()
+    if stored and stored[0] == stamp and not force:
+        return None
+
+    data = heat_map.load_city_data(city)
+    nodes = heat_map.node_dictionary(data)
+    boundary = load_boundary(city)
+    inside = boundary.contains_nodes(nodes) if boundary else nodes.keys()
+
+    citystrides_file = heat_map.find_citystrides_file(city)
+    targets = {}
+    target_ids = {}
+    if citystrides_file:
+        targets = heat_map.load_citystrides_points(citystrides_file, target_ids)
+        if not heat_map.ids_match_osm(target_ids, nodes):
+            target_ids = {}
+
+    with connection:
+        delete_city(connection, city)
+        street_ids = {}
+        street_by_node = {}
+        for name, paths in heat_map.street_dictionary(data).items():
+            street_ids[name] = connection.execute(
+                "INSERT INTO streets (city, name, length_km) VALUES (?, ?, ?)",
+                (city, name, heat_map.total_distance_km(paths, nodes)),
+            ).lastrowid
+            street_by_node.update(dict.fromkeys(chain.from_iterable(paths), street_ids[name]))
+        connection.executemany(
+            "INSERT INTO ways (city, osm_id, street, nodes) VALUES (?, ?, ?, ?)",
+            (
+                (
+                    city,
+                    element["id"],
+                    street_ids[element.get("tags", {}).get("name", "unnamed")],
+                    json.dumps(element["nodes"]),
+                )
+                for element in data["elements"]
+                if element["type"] == "way"
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO nodes (city, osm_id, lat, lon, street, inside) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (city, node_id, *point, street_by_node[node_id], node_id in inside)
+                for node_id, point in nodes.items()
+                if node_id in street_by_node
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO targets (city, lat, lon) VALUES (?, ?, ?)",
+            ((city, *point) for point in sorted(chain.from_iterable(targets.values()))),
+        )
+        connection.executemany(
+            "INSERT INTO target_nodes (city, osm_id) VALUES (?, ?)",
+            ((city, node_id) for node_id in target_ids),
+        )
+        for table, index in [("nodes", "node_index"), ("targets", "target_index")]:
+            connection.execute(
+                f"INSERT INTO {index} SELECT id, lat, lat, lon, lon FROM {table} WHERE city = ?",
+                (city,),
+            )
+        connection.execute(
+            "INSERT INTO cities (name, source, has_targets) VALUES (?, ?, ?)",
+            (city, stamp, citystrides_file is not None),
+        )
+    return {
+        "nodes": len(street_by_node.keys() & nodes.keys()),
+        "streets": len(street_ids),
+        "targets": sum(len(points) for points in targets.values()),
+    }
+
+
+def bbox_parameters(bbox: list[float], margin: float = 0.0) -> dict[str, float]:
+    south, west, north, east = bbox
+    return {
+        "south": south - margin,
+        "west": west - margin,
+        "north": north + margin,
+        "east": east + margin,
+    }
+
+
+def stored_street_paths(
+    connection: sqlite3.Connection, street: int, city: str, clip: bool
+) -> list:
+    """The drawable pieces of a stored street, as ``street_paths`` returns them."""
+
+    paths = [
+        json.loads(nodes)
+        for (nodes,) in connection.execute(
+            "SELECT nodes FROM ways WHERE street = ? ORDER BY id", (street,)
+        )
+    ]
+    ids = sorted(set(chain.from_iterable(paths)))
+    nodes = {}
+    inside = set()
+    for start in range(0, len(ids), ID_CHUNK):
+        chunk = ids[start : start + ID_CHUNK]
+        for osm_id, lat, lon, node_inside in connection.execute(
+            "SELECT osm_id, lat, lon, inside FROM nodes "
+            f"WHERE city = ? AND osm_id IN ({','.join('?' * len(chunk))})",
+            (city, *chunk),
+        ):
+            nodes[osm_id] = lat, lon
+            if node_inside:
+                inside.add(osm_id)
+    return heat_map.street_paths(paths, nodes, inside if clip else None)
+
+
+def query_rows(
+    connection: sqlite3.Connection,
+    bbox: list[float],
+    settings: dict,
+    cities: list[str] | None = None,
+    polylines: list[dict] | None = None,
+) -> list[list]:
+    """Return the heat-map rows of the stored street nodes inside ``bbox``.
+
+    Each city's nodes are selected and matched against its own targets as
+    ``process_city_data`` does.  A node shared by overlapping cities is
+    emitted once, for the first of them alphabetically that selects it.
+    """
+
+    has_targets = dict(connection.execute("SELECT name, has_targets FROM cities"))
+    missing = [city for city in cities or [] if city not in has_targets]
+    if missing:
+        raise ValueError(f"not in {STORE.name}: {', '.join(missing)}")
+    selected = set(cities or has_targets)
+    clip = bool(settings["heat_map_clip_to_boundary"])
+    filter_to_citystrides = bool(settings["heat_map_exclude_csnodes"])
+
+    buckets = defaultdict(lambda: defaultdict(set))
+    if filter_to_citystrides:
+        for city, lat, lon in connection.execute(
+            TARGETS_WITHIN, bbox_parameters(bbox, TARGET_MARGIN_DEG)
+        ):
+            buckets[city][heat_map.point_bucket((lat, lon))].add((lat, lon))
+
+    rows = []
+    emitted = set()
+    streets = {}
+    candidates = connection.execute(
+        NODES_WITHIN, bbox_parameters(bbox) | {"ceiling": heat_map.length_ceiling(settings)}
+    )
+    for city, osm_id, lat, lon, inside, street, name, length, listed in candidates:
+        if city not in selected or (clip and not inside) or osm_id in emitted:
+            continue
+        if (
+            filter_to_citystrides
+            and has_targets[city]
+            and not listed
+            and not heat_map.is_close_to_citystrides_node(buckets[city], (lat, lon))
+        ):
+            continue
+        emitted.add(osm_id)
+        rows.append([lat, lon, 2, f"Name: {osm_id} ({city})", length, name])
+        streets.setdefault(street, (city, name, length))
+
+    if polylines is not None:
+        for street, (city, name, length) in streets.items():
+            polylines.append(
+                {
+                    "street": name,
+                    "city": city,
+                    "length": length,
+                    "paths": stored_street_paths(connection, street, city, clip),
+                }
+            )
+    cities_used = {city for city, _, _ in streets.values()}
+    print(f"✓ {len(rows):,} heat-map nodes from {len(cities_used)} cities in the area")
+    return rows
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Load city datasets and CityStrides targets into the spatial store"
+    )
+    parser.add_argument(
+        "cities", nargs="*", help="cities to upsert (default: every data/ city)"
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=STORE,
+        help="SQLite store path (default: spatial.sqlite)",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="reload cities even if their files are unchanged"
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    cities = [heat_map.normalized_city_name(city) for city in args.cities] or sorted(
+        path.stem for path in (ROOT / "data").glob("*.json")
+    )
+    missing = [city for city in cities if not (ROOT / "data" / f"{city}.json").exists()]
+    if missing:
+        print(f"✗ Missing city data: {', '.join(missing)}")
+        return 1
+
+    try:
+        connection = connect(args.store, create=True)
+        for city in cities:
+            counts = ingest_city(connection, city, args.force)
+            if counts is None:
+                print(f"ℹ {city}: unchanged")
+                continue
+            print(
+                f"✓ {city}: {counts['nodes']:,} street nodes, {counts['streets']:,} "
+                f"streets, {counts['targets']:,} targets"
+            )
+        connection.close()
+    except (OSError, ValueError, KeyError, json.JSONDecodeError, sqlite3.Error) as error:
+        print(f"✗ Could not update {args.store.name}: {error}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
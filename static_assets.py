@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+"""Content-hashed, precompressed static assets for the published pages.
+
+Run pages and heat maps inline their data, so every regeneration changes the
+whole file and nothing can be cached.  ``write_asset`` stores such a payload as
+``assets/<name>.<hash>.js``, which never changes once written, next to gzip
+(and, when the ``brotli`` module is installed, brotli) variants and a
+``manifest.json``.  The payload is a classic script that sets a global, so
+pages still load it synchronously and keep working from ``file://``.
+
+``./static_assets.py SITE`` applies this to the run pages of a copied site,
+as the Pages workflow does before upload; the committed pages stay
+self-contained because the index and run tools parse their ``routeData``.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip variants are always written.
+    brotli = None
+
+ASSET_DIR = "assets"
+MANIFEST_NAME = "manifest.json"
+HASH_LENGTH = 12
+# Text files worth serving precompressed.
+COMPRESSIBLE = {".html", ".js", ".json", ".css", ".svg"}
+RUN_DIRECTORIES = ["upcoming_runs", "past_runs"]
+
+ROUTE_DATA = re.compile(
+    r'<script id="routeData" type="application/json">(.*?)</script>\n?', re.DOTALL
+)
+ROUTE_DATA_READ = "JSON.parse(document.getElementById('routeData').textContent)"
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    temporary = path.with_name(path.name + ".tmp")
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+
+def precompress(path: Path) -> list[Path]:
+    """Write ``.gz`` (and ``.br``) variants of a file and return their paths."""
+
+    data = path.read_bytes()
+    variants = [(path.with_name(path.name + ".gz"), gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append((path.with_name(path.name + ".br"), brotli.compress(data)))
+    for variant, compressed in variants:
+        if not variant.exists() or variant.read_bytes() != compressed:
+            write_atomic(variant, compressed)
+    return [variant for variant, _ in variants]
+
+
+def load_manifest(directory: Path) -> dict[str, dict]:
+    path = directory / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    with path.open(encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def write_asset(directory: Path, name: str, script: str) -> str:
+    """Store ``script`` as ``directory/<name>.<hash>.js`` and return the file name.
+
+    Older versions of the same asset are removed and the directory's manifest
+    maps ``name`` to the current file, its hash and sizes.
+    """
+
+    data = script.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    filename = f"{name}.{digest[:HASH_LENGTH]}.js"
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / filename
+    if not path.exists():
+        write_atomic(path, data)
+    variants = precompress(path)
+
+    manifest = load_manifest(directory)
+    previous = manifest.get(name, {}).get("file")
+    if previous and previous != filename:
+        for stale in directory.glob(f"{previous}*"):
+            stale.unlink()
+    manifest[name] = {
+        "file": filename,
+        "sha256": digest,
+        "bytes": len(data),
+        **{variant.suffix.lstrip("."): variant.stat().st_size for variant in variants},
+    }
+    text = json.dumps(manifest, indent=2, sort_keys=True) + "\n"
+    write_atomic(directory / MANIFEST_NAME, text.encode("utf-8"))
+    return filename
+
+
+def split_run_page(page: Path) -> bool:
+    """Move a run page's ``routeData`` into a hashed asset beside it.
+
+    Pages without the expected data script are left alone.
+    """
+
+    html = page.read_text(encoding="utf-8")
+    match = ROUTE_DATA.search(html)
+    if not match or ROUTE_DATA_READ not in html:
+        return False
+    # The JSON already has "<" escaped for the script element it came from.
+    filename = write_asset(
+        page.parent / ASSET_DIR, page.stem, f"window.routeData = {match.group(1)};\n"
+    )
+    html = (
+        html[: match.start()]
+        + f'<script src="{ASSET_DIR}/{filename}"></script>\n'
+        + html[match.end():]
+    ).replace(ROUTE_DATA_READ, "window.routeData")
+    write_atomic(page, html.encode("utf-8"))
+    return True
+
+
+def prepare_site(site: Path) -> tuple[int, int]:
+    """Split every run page of a copied site and precompress its text files.
+
+    Returns the number of pages split and of files precompressed.
+    """
+
+    split = 0
+    for folder in RUN_DIRECTORIES:
+        for page in sorted((site / folder).glob("*.html")):
+            split += split_run_page(page)
+
+    compressed = 0
+    for path in sorted(site.rglob("*")):
+        if path.is_file() and path.suffix in COMPRESSIBLE:
+            precompress(path)
+            compressed += 1
+    return split, compressed
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Split run-page data into hashed assets and precompress a site"
+    )
+    parser.add_argument("site", type=Path, help="copied site directory, such as _site")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        split, compressed = prepare_site(args.site)
+    except (OSError, ValueError) as error:
+        print(f"✗ Could not prepare {args.site}: {error}")
+        return 1
+    formats = "gzip and brotli" if brotli is not None else "gzip"
+    print(f"✓ Moved the route data of {split} run pages into hashed assets")
+    print(f"✓ Precompressed {compressed} files with {formats}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+
+"""A compact street graph for ordering visits to a city's short streets.
+
+The OSM ways of ``data/<city>.json`` become an undirected graph in compressed
+sparse row form: every way node is an index, and each consecutive node pair
+is an edge weighted by its great-circle length in metres.  The arrays are
+cached in ``data/<city>.graph.npz`` until the dataset changes.
+
+``StreetGraph.search`` runs a multi-source Dijkstra, switching to A* towards
+a handful of targets, so a query takes milliseconds.  ``./street_graph.py
+CITY`` orders the short streets ``process_city_data`` selects with a greedy
+tour improved by 2-opt, then writes the route as an ``upcoming_runs/`` page.
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import re
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+import create_heat_map as heat_map
+
+ROOT = heat_map.ROOT
+EARTH_RADIUS_M = 6_371_008.8
+# Above this many targets the A* heuristic costs more than it saves.
+A_STAR_TARGETS = 8
+NODE_NAME = re.compile(r"^Name: (?P<id>-?\d+) ")
+GRAPH_ARRAYS = ["osm_ids", "lat", "lon", "indptr", "indices", "lengths"]
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres between coordinate arrays."""
+
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def point_distance_m(a: tuple[float, float], b: tuple[float, float]) -> float:
+    """``haversine_m`` for one pair of points, without numpy's call overhead."""
+
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+
+class StreetGraph:
+    """Way nodes and their connecting segments in CSR arrays.
+
+    The neighbours of node ``i`` are ``indices[indptr[i]:indptr[i + 1]]`` with
+    the matching ``lengths`` in metres; ``osm_ids`` is sorted so OSM ids map to
+    indices by binary search.
+    """
+
+    def __init__(self, osm_ids, lat, lon, indptr, indices, lengths):
+        self.osm_ids = osm_ids
+        self.lat = lat
+        self.lon = lon
+        self.indptr = indptr
+        self.indices = indices
+        self.lengths = lengths
+        # Python lists make the per-edge loop of a search several times faster.
+        self._indptr = indptr.tolist()
+        self._indices = indices.tolist()
+        self._lengths = lengths.tolist()
+        self._points = list(zip(lat.tolist(), lon.tolist(), strict=True))
+
+    @classmethod
+    def from_city_data(cls, data: dict) -> "StreetGraph":
+        nodes = heat_map.node_dictionary(data)
+        pairs = [
+            (a, b)
+            for element in data["elements"]
+            if element["type"] == "way"
+            for a, b in zip(element["nodes"][:-1], element["nodes"][1:], strict=True)
+            if a != b and a in nodes and b in nodes
+        ]
+        edges = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        osm_ids = np.unique(edges)
+        points = np.array([nodes[node_id] for node_id in osm_ids.tolist()], dtype=float)
+        points = points.reshape(-1, 2)
+
+        edges = np.searchsorted(osm_ids, edges)
+        sources = np.concatenate([edges[:, 0], edges[:, 1]])
+        targets = np.concatenate([edges[:, 1], edges[:, 0]])
+        order = np.lexsort((targets, sources))
+        sources, targets = sources[order], targets[order]
+        indptr = np.zeros(len(osm_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(osm_ids)), out=indptr[1:])
+        lengths = haversine_m(
+            points[sources, 0], points[sources, 1], points[targets, 0], points[targets, 1]
+        )
+        return cls(
+            osm_ids, points[:, 0], points[:, 1], indptr, targets.astype(np.int32), lengths
+        )
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in GRAPH_ARRAYS}
+
+    def index_of(self, osm_ids: list[int]) -> np.ndarray:
+        """Graph indices of OSM node ids, or -1 for ids not on any way."""
+
+        ids = np.asarray(osm_ids, dtype=np.int64)
+        if not len(self.osm_ids):
+            return np.full(len(ids), -1)
+        positions = np.searchsorted(self.osm_ids, ids).clip(max=len(self.osm_ids) - 1)
+        return np.where(self.osm_ids[positions] == ids, positions, -1)
+
+    def nearest(self, lat: float, lon: float) -> int:
+        return int(np.argmin(haversine_m(lat, lon, self.lat, self.lon)))
+
+    def search(
+        self,
+        sources: list[int],
+        targets: set[int] | None = None,
+        every_target: bool = False,
+    ) -> tuple[dict[int, float], dict[int, int], list[int]]:
+        """Shortest distances in metres from the nearest of ``sources``.
+
+        Without ``targets`` every reachable node is settled.  Otherwise the
+        search stops at the first target settled, using A* when there are few
+        of them, or once all are settled when ``every_target`` is set.
+        Returns the distances, each node's predecessor and the targets
+        reached in order.
+        """
+
+        goals = targets if targets is not None else set()
+        heuristic = {}
+        goal_points = [self._points[goal] for goal in goals]
+        use_a_star = goals and not every_target and len(goals) <= A_STAR_TARGETS
+
+        def estimate(node: int) -> float:
+            # Edges are great-circle segments, so this bound is admissible.
+            if not use_a_star:
+                return 0.0
+            if node not in heuristic:
+                heuristic[node] = min(
+                    point_distance_m(self._points[node], goal) for goal in goal_points
+                )
+            return heuristic[node]
+
+        distance = dict.fromkeys(sources, 0.0)
+        previous = {}
+        queue = [(estimate(node), 0.0, node) for node in distance]
+        heapq.heapify(queue)
+        settled = set()
+        reached = []
+        indptr, indices, lengths = self._indptr, self._indices, self._lengths
+        while queue:
+            _, length, node = heapq.heappop(queue)
+            if node in settled:
+                continue
+            settled.add(node)
+            if node in goals:
+                reached.append(node)
+                if not every_target or len(reached) == len(goals):
+                    break
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[edge]
+                candidate = length + lengths[edge]
+                if candidate < distance.get(neighbour, math.inf):
+                    distance[neighbour] = candidate
+                    previous[neighbour] = node
+                    heapq.heappush(queue, (candidate + estimate(neighbour), candidate, neighbour))
+        return distance, previous, reached
+
+    def path_to(self, previous: dict[int, int], node: int) -> list[int]:
+        path = [node]
+        while path[-1] in previous:
+            path.append(previous[path[-1]])
+        return path[::-1]
+
+
+def graph_path(city: str) -> Path:
+    return ROOT / "data" / f"{city}.graph.npz"
+
+
+def load_graph(city: str) -> tuple[StreetGraph, bool]:
+    """Return the city's graph and whether it came from the on-disk cache."""
+
+    source = ROOT / "data" / f"{city}.json"
+    status = source.stat()
+    stamp = np.array([status.st_size, status.st_mtime_ns], dtype=np.int64)
+    path = graph_path(city)
+    if path.exists():
+        with np.load(path) as stored:
+            if stored["source"].tolist() == stamp.tolist():
+                return StreetGraph(**{name: stored[name] for name in GRAPH_ARRAYS}), True
+
+    graph = StreetGraph.from_city_data(heat_map.load_city_data(city))
+    with path.open("wb") as handle:
+        np.savez(handle, source=stamp, **graph.arrays())
+    return graph, False
+
+
+def street_clusters(graph: StreetGraph, rows: list[list]) -> list[dict]:
+    """Group heat-map rows into one stop per short street."""
+
+    grouped = defaultdict(list)
+    for row in rows:
+        match = NODE_NAME.match(row[3])
+        if match:
+            grouped[row[5], row[4]].append(int(match["id"]))
+    clusters = []
+    for (name, length), osm_ids in grouped.items():
+        indices = graph.index_of(osm_ids)
+        found = [
+            (osm_id, index)
+            for osm_id, index in zip(osm_ids, indices.tolist(), strict=True)
+            if index >= 0
+        ]
+        if found:
+            clusters.append(
+                {
+                    "street": name,
+                    "length": length,
+                    "osm_ids": [osm_id for osm_id, _ in found],
+                    "nodes": [index for _, index in found],
+                }
+            )
+    return clusters
+
+
+def distance_matrix(graph: StreetGraph, start: int, clusters: list[dict]) -> np.ndarray:
+    """Walking distances between the start (row 0) and every cluster."""
+
+    groups = [[start]] + [cluster["nodes"] for cluster in clusters]
+    owner = {node: position for position, group in enumerate(groups) for node in group}
+    matrix = np.full((len(groups), len(groups)), np.inf)
+    for position, group in enumerate(groups):
+        distance, _, _ = graph.search(group, set(owner), every_target=True)
+        for node, other in owner.items():
+            if node in distance:
+                matrix[position, other] = min(matrix[position, other], distance[node])
+    # The graph is undirected, so keep the shorter of the two directions.
+    return np.minimum(matrix, matrix.T)
+
+
+def greedy_tour(matrix: np.ndarray) -> list[int]:
+    """Nearest-neighbour tour from row 0 through every other row."""
+
+    tour = [0]
+    remaining = set(range(1, len(matrix)))
+    while remaining:
+        following = min(remaining, key=lambda other: (matrix[tour[-1], other], other))
+        tour.append(following)
+        remaining.remove(following)
+    return tour
+
+
+def two_opt(matrix: np.ndarray, tour: list[int]) -> list[int]:
+    """Reverse tour sections while that shortens the closed loop."""
+
+    tour = list(tour)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(tour) - 1):
+            for j in range(i + 1, len(tour)):
+                a, b = tour[i - 1], tour[i]
+                c, d = tour[j], tour[(j + 1) % len(tour)]
+                if matrix[a, c] + matrix[b, d] < matrix[a, b] + matrix[c, d] - 1e-6:
+                    tour[i : j + 1] = reversed(tour[i : j + 1])
+                    improved = True
+    return tour
+
+
+def walk(graph: StreetGraph, start: int, clusters: list[dict]) -> tuple[list[int], float]:
+    """Graph path from ``start`` through every node of each cluster and back."""
+
+    path = [start]
+    metres = 0.0
+    for cluster in [*clusters, {"nodes": [start]}]:
+        remaining = set(cluster["nodes"]) - {path[-1]}
+        while remaining:
+            distance, previous, reached = graph.search([path[-1]], remaining)
+            if not reached:
+                break
+            leg = graph.path_to(previous, reached[0])
+            metres += distance[reached[0]]
+            path += leg[1:]
+            remaining -= set(leg)
+    return path, metres
+
+
+def plan_route(
+    graph: StreetGraph, rows: list[list], start: int, stops: int
+) -> tuple[list[dict], list[int], float]:
+    """Order the ``stops`` short streets nearest ``start`` and walk them.
+
+    Returns the streets in visiting order, the graph path and its length.
+    """
+
+    clusters = street_clusters(graph, rows)
+    distance, _, _ = graph.search([start])
+    reachable = [
+        (min(distance.get(node, math.inf) for node in cluster["nodes"]), position)
+        for position, cluster in enumerate(clusters)
+    ]
+    nearest = sorted(item for item in reachable if item[0] < math.inf)[:stops]
+    clusters = [clusters[position] for _, position in nearest]
+    if not clusters:
+        return [], [start], 0.0
+
+    matrix = distance_matrix(graph, start, clusters)
+    tour = two_opt(matrix, greedy_tour(matrix))
+    ordered = [clusters[position - 1] for position in tour[1:]]
+    path, metres = walk(graph, start, ordered)
+    return ordered, path, metres
+
+
+PAGE_TEMPLATE = """<!doctype html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1, viewport-fit=cover">
+  <title>CityStrides route</title>
+  <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css" crossorigin="">
+  <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js" crossorigin=""></script>
+  <style>
+    html, body, #map { height:100%; margin:0; }
+    .route-card { position:absolute; z-index:1000; top:12px; left:12px; right:12px; padding:10px 14px; border-radius:14px; background:rgba(28,12,48,.92); color:#fff; font:15px ui-sans-serif,system-ui,sans-serif; box-shadow:0 2px 12px rgba(35,8,70,.45); }
+    .route-card small { display:block; color:#c9c1d7; }
+    .km-marker { border:0; background:transparent; pointer-events:none; }
+    .km-marker span { display:flex; width:44px; height:24px; align-items:center; justify-content:center; border:2px solid #7c3aed; border-radius:12px; background:#fff; color:#4c1d95; box-shadow:0 1px 6px rgba(35,8,70,.55); font:900 12px/1 ui-sans-serif,system-ui,sans-serif; white-space:nowrap; }
+    .start-icon { border:0; background:transparent; }
+    .start-icon span { display:flex; width:26px; height:26px; border:4px solid #111; border-radius:50%; background:#fff; box-shadow:0 1px 5px rgba(0,0,0,.45); }
+  </style>
+</head>
+<body>
+  <div id="map"></div>
+  <div class="route-card"><strong id="routeTitle">CityStrides route</strong><small id="routeStats">Loading…</small></div>
+  <script id="routeData" type="application/json">__ROUTE_DATA__</script>
+  <script>
+    const data=JSON.parse(document.getElementById('routeData').textContent);
+    document.title=data.title;
+    document.getElementById('routeTitle').textContent=data.title;
+    document.getElementById('routeStats').textContent=`${data.distance_km.toFixed(1)} km · ${data.streets.length} short streets in visiting order`;
+    const map=L.map('map',{zoomControl:false,preferCanvas:true});
+    L.control.zoom({position:'bottomright'}).addTo(map);
+    L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png',{maxZoom:20,attribution:'&copy; OpenStreetMap contributors'}).addTo(map);
+    L.polyline(data.route,{color:'rgba(245,234,255,.82)',weight:9,lineCap:'round',lineJoin:'round'}).addTo(map);
+    L.polyline(data.route,{color:'rgba(124,58,237,.98)',weight:6,lineCap:'round',lineJoin:'round'}).addTo(map);
+    map.fitBounds(L.latLngBounds(data.route),{paddingTopLeft:[24,92],paddingBottomRight:[24,45]});
+    L.marker(data.route[0],{icon:L.divIcon({className:'start-icon',html:'<span></span>',iconSize:[26,26],iconAnchor:[13,13]})}).addTo(map);
+    for(const [id,lat,lon,status] of data.nodes)L.circleMarker([lat,lon],{radius:4,stroke:false,fillColor:status==='g'?'#39ff14':'#ff1744',fillOpacity:1}).bindTooltip(`${id}`).addTo(map);
+    let travelled=0,nextKm=1000;
+    for(let index=1;index<data.route.length;index++){
+      const from=data.route[index-1],to=data.route[index],segment=map.distance(from,to);
+      while(segment&&travelled+segment>=nextKm){
+        const fraction=(nextKm-travelled)/segment,point=[from[0]+(to[0]-from[0])*fraction,from[1]+(to[1]-from[1])*fraction];
+        L.marker(point,{interactive:false,icon:L.divIcon({className:'km-marker',html:`<span>${nextKm/1000} km</span>`,iconSize:[44,24],iconAnchor:[22,12]})}).addTo(map);
+        nextKm+=1000;
+      }
+      travelled+=segment;
+    }
+  </script>
+</body>
+</html>
+"""
+
+
+def run_name(city: str, distance_km: float, start: tuple[float, float]) -> str:
+    """A file stem in the ``upcoming_runs/`` naming scheme."""
+
+    km, tenths = divmod(round(distance_km * 10), 10)
+    lat, lon = (f"{abs(value):.5f}".replace(".", "-") for value in start)
+    return f"{city}-graph-greedy-{km}-{tenths}km-{lat}-{lon}"
+
+
+def route_page_data(
+    city: str, graph: StreetGraph, ordered: list[dict], path: list[int], metres: float
+) -> tuple[str, dict]:
+    """The file stem and ``routeData`` of a run page for a planned route."""
+
+    route = [[float(graph.lat[node]), float(graph.lon[node])] for node in path]
+    name = run_name(city, metres / 1000, route[0])
+    streets = []
+    nodes = []
+    for index, cluster in enumerate(ordered):
+        streets.append(
+            {
+                "name": cluster["street"],
+                "total": len(cluster["nodes"]),
+                "done": 0,
+                "goal": len(cluster["nodes"]),
+            }
+        )
+        nodes += [
+            [osm_id, float(graph.lat[node]), float(graph.lon[node]), "r", [[index, 1]]]
+            for osm_id, node in zip(cluster["osm_ids"], cluster["nodes"], strict=True)
+        ]
+
+    generated_at = None
+    citystrides_file = heat_map.find_citystrides_file(city)
+    meta = citystrides_file.with_name(f"{citystrides_file.stem}.meta.json") if citystrides_file else None
+    if meta and meta.exists():
+        with meta.open(encoding="utf-8") as handle:
+            generated_at = json.load(handle).get("generated_at")
+    digest = hashlib.sha256(json.dumps(route).encode("utf-8")).hexdigest()
+    return name, {
+        "run_id": f"{name}-{digest[:12]}",
+        "title": f"{city.replace('_', ' ').title()} short streets",
+        "distance_km": round(metres / 1000, 2),
+        "target_generated_at": generated_at,
+        "route": route,
+        "streets": streets,
+        "nodes": nodes,
+    }
+
+
+def write_route_page(route_data: dict, path: Path) -> None:
+    text = json.dumps(route_data, separators=(",", ":")).replace("<", "\\u003c")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(PAGE_TEMPLATE.replace("__ROUTE_DATA__", text), encoding="utf-8")
+
+
+def parse_point(text: str) -> tuple[float, float]:
+    values = [float(value) for value in text.split(",")]
+    if len(values) != 2:
+        raise argparse.ArgumentTypeError("expected LAT,LON")
+    return values[0], values[1]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Order a city's short streets into a route from a start point"
+    )
+    parser.add_argument("city", help="city dataset name")
+    parser.add_argument(
+        "--start",
+        type=parse_point,
+        metavar="LAT,LON",
+        help="start and finish point (default: the centre of the short streets)",
+    )
+    parser.add_argument(
+        "--stops",
+        type=int,
+        default=20,
+        help="short streets to visit, nearest to the start first (default: 20)",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="run page path (default: upcoming_runs/<run name>.html)",
+    )
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=ROOT / "parameters.yaml",
+        help="heat-map YAML settings (default: parameters.yaml)",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    city = heat_map.normalized_city_name(args.city)
+    if not (ROOT / "data" / f"{city}.json").exists():
+        print(f"✗ Missing city data: {city}")
+        return 1
+
+    try:
+        started = time.perf_counter()
+        graph, cached = load_graph(city)
+        print(
+            f"✓ Street graph: {len(graph.osm_ids):,} nodes, {len(graph.indices) // 2:,} "
+            f"segments ({'cached' if cached else 'built'} in "
+            f"{time.perf_counter() - started:.2f}s)"
+        )
+        settings = heat_map.load_settings(args.config)
+        rows = [
+            row
+            for row in heat_map.process_city_data(city, settings)
+            if row[4] < float(settings["heat_map_max_length"])
+        ]
+        if not rows:
+            print(f"ℹ {city} has no short streets left to visit")
+            return 0
+        lat, lon = args.start or np.mean([row[:2] for row in rows], axis=0)
+        start = graph.nearest(lat, lon)
+
+        started = time.perf_counter()
+        ordered, path, metres = plan_route(graph, rows, start, args.stops)
+        name, route_data = route_page_data(city, graph, ordered, path, metres)
+        output = args.output or ROOT / "upcoming_runs" / f"{name}.html"
+        write_route_page(route_data, output)
+    except (OSError, ValueError, KeyError, json.JSONDecodeError) as error:
+        print(f"✗ Could not plan a route: {error}")
+        return 1
+
+    print(
+        f"✓ Ordered {len(ordered)} short streets into {metres / 1000:.1f} km "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    print(f"✓ Created {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import apply_osm_changes as updater
+
+CITY = {
+    "version": 0.6,
+    "osm3s": {"timestamp_osm_base": "2026-01-01T00:00:00Z"},
+    "elements": [
+        {"type": "node", "id": 1, "lat": 44.5, "lon": -79.9},
+        {"type": "node", "id": 2, "lat": 44.5, "lon": -79.89},
+        {"type": "node", "id": 3, "lat": 44.51, "lon": -79.89},
+        {"type": "way", "id": 10, "nodes": [1, 2], "tags": {"highway": "residential", "name": "Main Street"}},
+        {"type": "way", "id": 11, "nodes": [2, 3], "tags": {"highway": "residential", "name": "Side Road"}},
+    ],
+}
+FAR_CITY = {
+    "version": 0.6,
+    "elements": [
+        {"type": "node", "id": 100, "lat": 10.0, "lon": 10.0},
+        {"type": "node", "id": 101, "lat": 10.01, "lon": 10.0},
+        {"type": "way", "id": 200, "nodes": [100, 101], "tags": {"highway": "residential", "name": "Far Road"}},
+    ],
+}
+CHANGE = """<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6">
+  <modify>
+    <node id="2" lat="44.5002" lon="-79.89" timestamp="2026-03-01T10:00:00Z"/>
+  </modify>
+  <delete>
+    <way id="11" timestamp="2026-03-01T11:00:00Z"/>
+    <node id="3" timestamp="2026-03-01T11:00:00Z"/>
+  </delete>
+  <create>
+    <node id="4" lat="44.505" lon="-79.895" timestamp="2026-03-02T08:00:00Z"/>
+    <way id="12" timestamp="2026-03-02T08:00:00Z">
+      <nd ref="1"/><nd ref="4"/>
+      <tag k="highway" v="residential"/><tag k="name" v="New Lane"/>
+    </way>
+  </create>
+</osmChange>
+"""
+
+
+class ApplyChangesTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_dir = Path(directory.name)
+        patcher = mock.patch.object(updater, "DATA_DIR", self.data_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for city, data in [("tiny", CITY), ("far", FAR_CITY)]:
+            (self.data_dir / f"{city}.json").write_text(json.dumps(data, indent=2) + "\n")
+        self.change = self.data_dir / "update.osc"
+        self.change.write_text(CHANGE)
+
+    def load(self, city: str) -> dict:
+        return json.loads((self.data_dir / f"{city}.json").read_text())
+
+    def test_edits_reach_only_the_affected_city(self):
+        far_before = (self.data_dir / "far.json").read_bytes()
+        edited = updater.apply_changes([self.change], ["far", "tiny"])
+
+        self.assertEqual(list(edited), ["tiny"])
+        self.assertEqual((self.data_dir / "far.json").read_bytes(), far_before)
+        data = self.load("tiny")
+        ways = {e["id"]: e for e in data["elements"] if e["type"] == "way"}
+        nodes = {e["id"]: e for e in data["elements"] if e["type"] == "node"}
+        self.assertEqual(sorted(ways), [10, 12])
+        self.assertEqual(ways[12]["tags"]["name"], "New Lane")
+        self.assertEqual(sorted(nodes), [1, 2, 4])
+        self.assertEqual(nodes[2]["lat"], 44.5002)
+        self.assertEqual(data["osm3s"]["timestamp_osm_base"], "2026-03-02T08:00:00Z")
+
+    def test_reapplying_a_change_rewrites_nothing(self):
+        updater.apply_changes([self.change], ["far", "tiny"])
+        self.assertEqual(updater.apply_changes([self.change], ["far", "tiny"]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest import mock
+
+import build_run_index as index
+
+PAGE = """<!doctype html>
+<html><body>
+<script id="routeData" type="application/json">{data}</script>
+</body></html>
+"""
+INDEX = """<section class="runs">
+<!-- {marker}_START -->
+<!-- {marker}_END -->
+</section>
+"""
+
+
+def write_run(directory: Path, name: str, distance: float) -> None:
+    data = {
+        "title": "Tiny route",
+        "distance_km": distance,
+        "target_generated_at": "2026-08-05T16:01:47+00:00",
+        "route": [[44.5, -79.9], [44.6, -79.8]],
+        "nodes": [[1, 44.5, -79.9, "b", []]],
+        "streets": [{"name": "Crossland Road", "total": 3, "done": 1, "goal": 2}],
+    }
+    (directory / name).write_text(PAGE.format(data=json.dumps(data)), encoding="utf-8")
+
+
+class RunIndexTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.upcoming = self.root / "upcoming_runs"
+        self.past = self.root / "past_runs"
+        self.upcoming.mkdir()
+        self.past.mkdir()
+        (self.root / "index.html").write_text(INDEX.format(marker="UPCOMING_RUNS"))
+        (self.root / "past_runs.html").write_text(INDEX.format(marker="PAST_RUNS"))
+        for name, value in {
+            "ROOT": self.root,
+            "UPCOMING_DIR": self.upcoming,
+            "PAST_DIR": self.past,
+            "COMPLETED_FILE": self.past / "completed.json",
+        }.items():
+            patcher = mock.patch.object(index, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_summaries_are_reused_until_the_page_changes(self):
+        name = "tiny-manual-manual-15-5km-44-50000-79-90000.html"
+        write_run(self.upcoming, name, 14.66)
+
+        summaries, parsed = index.refresh_summaries(self.upcoming)
+        self.assertEqual(parsed, 1)
+        summary = summaries[name]
+        self.assertEqual(summary["city"], "tiny")
+        self.assertEqual(summary["planned_km"], 15.5)
+        self.assertEqual(summary["bbox"], [44.5, -79.9, 44.6, -79.8])
+        self.assertEqual((summary["node_count"], summary["street_count"]), (1, 1))
+
+        self.assertEqual(index.refresh_summaries(self.upcoming)[1], 0)
+        write_run(self.upcoming, name, 15.0)
+        summaries, parsed = index.refresh_summaries(self.upcoming)
+        self.assertEqual((parsed, summaries[name]["distance_km"]), (1, 15.0))
+
+    def test_completing_a_run_moves_its_card_without_reparsing(self):
+        first = "tiny-manual-manual-15-5km-44-50000-79-90000.html"
+        second = "tiny-manual-manual-20-0km-44-60000-79-80000.html"
+        write_run(self.upcoming, first, 14.66)
+        write_run(self.upcoming, second, 19.2)
+        index.build_indexes()
+
+        moment = datetime(2026, 8, 7, 14, 7, tzinfo=timezone(timedelta(hours=-4)))
+        index.complete_run(first, moment)
+        with mock.patch.object(index, "summarize_run", side_effect=AssertionError):
+            index.build_indexes()
+
+        upcoming = (self.root / "index.html").read_text()
+        past = (self.root / "past_runs.html").read_text()
+        self.assertNotIn(first, upcoming)
+        self.assertIn(second, upcoming)
+        self.assertIn("<span>14.7 km</span>", past)
+        self.assertIn("Completed Aug 7, 2026 at 2:07 PM", past)
+        self.assertTrue((self.past / first).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import boundaries
+import check_heat_map_engine as harness
+import create_heat_map as heat_map
+
+DATA = {
+    "elements": [
+        {"type": "node", "id": 1, "lat": 44.5, "lon": -79.9},
+        {"type": "node", "id": 2, "lat": 44.501, "lon": -79.9},
+        {"type": "node", "id": 3, "lat": 44.502, "lon": -79.9},
+        {"type": "way", "id": 10, "nodes": [1, 2, 3], "tags": {"name": "Short Lane"}},
+    ],
+}
+
+
+def shifted_engine(offset: float) -> SimpleNamespace:
+    """A candidate whose street lengths are off by ``offset`` km."""
+
+    reference = heat_map.process_city_data
+
+    def process_city_data(city, settings, seen=None, polylines=None):
+        return [[*row[:4], row[4] + offset, row[5]] for row in reference(city, settings)]
+
+    return SimpleNamespace(process_city_data=process_city_data)
+
+
+class EngineHarnessTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        for folder in ("data", "csnodes", "reference_nodes"):
+            (self.root / folder).mkdir()
+        (self.root / "data" / "tiny.json").write_text(json.dumps(DATA))
+        (self.root / "csnodes" / "tiny.csv").write_text("lat,lon\n44.5,-79.9\n44.502,-79.9\n")
+        for module, name, value in [
+            (heat_map, "ROOT", self.root),
+            (harness, "ROOT", self.root),
+            (harness, "REFERENCE_DIR", self.root / "reference_nodes"),
+            (boundaries, "BOUNDARY_DIR", self.root / "boundaries"),
+        ]:
+            patcher = mock.patch.object(module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.settings = heat_map.load_settings(self.root / "missing.yaml")
+
+    def test_differences_beyond_the_tolerance_are_reported(self):
+        close = harness.check_city("tiny", self.settings, shifted_engine(1e-12))
+        self.assertEqual((close["rows"], close["problems"]), (2, []))
+
+        far = harness.check_city("tiny", self.settings, shifted_engine(1e-3))
+        self.assertEqual(len(far["problems"]), 1)
+        self.assertIn("2 differ in len_cat", far["problems"][0])
+        self.assertEqual(heat_map.process_city_data.__module__, "create_heat_map")
+
+    def test_reference_results_are_cached_until_an_input_changes(self):
+        self.assertFalse(harness.check_city("tiny", self.settings, heat_map)["cached"])
+        self.assertTrue(harness.check_city("tiny", self.settings, heat_map)["cached"])
+
+        (self.root / "csnodes" / "tiny.csv").write_text("lat,lon\n44.5,-79.9\n")
+        result = harness.check_city("tiny", self.settings, heat_map)
+        self.assertEqual((result["cached"], result["rows"]), (False, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
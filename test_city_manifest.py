@@ -0,0 +1,65 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import city_manifest as manifest
+import create_heat_map as heat_map
+
+DATA = {
+    "osm3s": {"timestamp_osm_base": "2024-07-14T22:56:21Z"},
+    "elements": [
+        {"type": "node", "id": 1, "lat": 44.5, "lon": -79.9},
+        {"type": "node", "id": 2, "lat": 44.501, "lon": -79.9},
+        {"type": "node", "id": 3, "lat": 44.6, "lon": -79.8},
+        {"type": "way", "id": 10, "nodes": [1, 2], "tags": {"name": "Short Lane"}},
+        {"type": "way", "id": 11, "nodes": [2, 3], "tags": {"name": "Long Road"}},
+    ],
+}
+
+
+class CityManifestTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        for folder in ("data", "csnodes", "cache"):
+            (self.root / folder).mkdir()
+        (self.root / "data" / "tiny.json").write_text(json.dumps(DATA))
+        (self.root / "csnodes" / "tiny.csv").write_text(
+            "lat,lon,sz,names,len_cat\n44.5,-79.9,2,Short Lane (1),a\n"
+        )
+        (self.root / "cache" / "tiny.csv").write_text("-79.8,44.6,-79.9,44.5\n")
+        for module in (manifest, heat_map):
+            patcher = mock.patch.object(module, "ROOT", self.root)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.path = self.root / "city_manifest.json"
+        self.settings = {"heat_map_max_length": 1.0}
+
+    def test_statistics_are_recorded_and_unchanged_files_are_not_reparsed(self):
+        cities, parsed = manifest.refresh_manifest(self.settings, self.path)
+        self.assertEqual(parsed, 3)
+        entry = cities["cities"]["tiny"]
+        self.assertEqual(entry["data"]["bbox"], [44.5, -79.9, 44.6, -79.8])
+        self.assertEqual(
+            (entry["data"]["nodes"], entry["data"]["ways"], entry["data"]["short_streets"]),
+            (3, 2, 1),
+        )
+        self.assertEqual(entry["csnodes"]["path"], "csnodes/tiny.csv")
+        self.assertEqual(entry["cache"]["tiles"], 1)
+
+        self.assertEqual(manifest.refresh_manifest(self.settings, self.path)[1], 0)
+        (self.root / "cache" / "tiny.csv").write_text("-79.8,44.6,-79.9,44.5\n" * 2)
+        cities, parsed = manifest.refresh_manifest(self.settings, self.path)
+        self.assertEqual((parsed, cities["cities"]["tiny"]["cache"]["tiles"]), (1, 2))
+
+    def test_cities_are_selected_by_bounding_box(self):
+        cities, _ = manifest.refresh_manifest(self.settings, self.path)
+        self.assertEqual(manifest.cities_within(cities, [44.55, -79.85, 45, -79]), ["tiny"])
+        self.assertEqual(manifest.cities_within(cities, [45, -79.85, 46, -79]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,438 @@
+import base64
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import boundaries
+import create_heat_map as heat_map
+from hotspots import cluster_hotspots
+
+
+def node_frame(points: list[tuple[float, float, str, float]]) -> pd.DataFrame:
+    return pd.DataFrame(
+        [
+            [lat, lon, 2, f"Name: {index} (tiny)", length, street]
+            for index, (lat, lon, street, length) in enumerate(points)
+        ],
+        columns=heat_map.NODE_COLUMNS,
+    )
+
+
+def osm_data(nodes: dict[int, tuple[float, float]], ways: dict[int, tuple]) -> dict:
+    elements = [
+        {"type": "node", "id": node_id, "lat": lat, "lon": lon}
+        for node_id, (lat, lon) in nodes.items()
+    ]
+    elements += [
+        {"type": "way", "id": way_id, "nodes": list(path), "tags": {"name": name}}
+        for way_id, (name, *path) in ways.items()
+    ]
+    return {"elements": elements}
+
+
+class CombinedBuildTest(unittest.TestCase):
+    def test_shared_nodes_and_ways_are_emitted_for_the_first_city_only(self):
+        nodes = {1: (44.5, -79.9), 2: (44.501, -79.9), 3: (44.502, -79.9)}
+        datasets = {
+            "north": osm_data(nodes, {10: ("Main Street", 1, 2)}),
+            "south": osm_data(nodes, {10: ("Main Street", 1, 2), 11: ("Side Road", 2, 3)}),
+        }
+        settings = heat_map.load_settings(heat_map.ROOT / "missing.yaml")
+        seen = {"node": set(), "way": set()}
+        with (
+            mock.patch.object(heat_map, "load_city_data", datasets.get),
+            mock.patch.object(heat_map, "find_citystrides_file", return_value=None),
+        ):
+            north = heat_map.process_city_data("north", settings, seen)
+            south = heat_map.process_city_data("south", settings, seen)
+
+        self.assertEqual([row[3] for row in north], ["Name: 1 (north)", "Name: 2 (north)"])
+        self.assertEqual([row[3] for row in south], ["Name: 3 (south)"])
+        self.assertEqual(seen["node"], {1, 2, 3})
+
+    def test_streets_split_across_datasets_are_measured_in_full(self):
+        nodes = {1: (44.5, -79.9), 2: (44.505, -79.9), 3: (44.511, -79.9)}
+        datasets = {
+            "a": osm_data(nodes, {10: ("Main Street", 1, 2)}),
+            "b": osm_data(nodes, {10: ("Main Street", 1, 2), 11: ("Main Street", 2, 3)}),
+        }
+        settings = heat_map.load_settings(heat_map.ROOT / "missing.yaml")
+        settings["heat_map_thresholds"] = [1.0]
+        seen = {"node": set(), "way": set()}
+        with (
+            mock.patch.object(heat_map, "load_city_data", datasets.get),
+            mock.patch.object(heat_map, "find_citystrides_file", return_value=None),
+            mock.patch.object(heat_map, "load_boundary", return_value=None),
+        ):
+            alone = heat_map.process_city_data("b", settings)
+            first = heat_map.process_city_data("a", settings, seen)
+            second = heat_map.process_city_data("b", settings, seen)
+
+        # Main Street is 1.22 km over both ways, too long for the map.
+        self.assertEqual(alone, [])
+        self.assertEqual(len(first), 2)
+        self.assertEqual(second, [])
+
+    def test_ways_clipped_out_of_one_city_still_appear_in_the_next(self):
+        nodes = {1: (44.5, -79.9), 2: (44.501, -79.9), 3: (44.5, -78.9), 4: (44.501, -78.9)}
+        ways = {10: ("Main Street", 1, 2), 11: ("East Lane", 3, 4)}
+        west, east = (
+            boundaries.Boundary(
+                {
+                    "type": "Polygon",
+                    "coordinates": [[[w, 44], [w + 1, 44], [w + 1, 45], [w, 45], [w, 44]]],
+                }
+            )
+            for w in (-80, -79)
+        )
+        settings = heat_map.load_settings(heat_map.ROOT / "missing.yaml")
+        seen = {"node": set(), "way": set()}
+        polylines = []
+        with (
+            mock.patch.object(heat_map, "load_city_data", return_value=osm_data(nodes, ways)),
+            mock.patch.object(heat_map, "find_citystrides_file", return_value=None),
+            mock.patch.object(heat_map, "load_boundary", {"a": west, "b": east}.get),
+        ):
+            rows = heat_map.process_city_data("a", settings, seen, polylines)
+            rows += heat_map.process_city_data("b", settings, seen, polylines)
+
+        self.assertEqual({row[5] for row in rows}, {"Main Street", "East Lane"})
+        self.assertEqual([polyline["city"] for polyline in polylines], ["a", "b"])
+        self.assertEqual(seen["way"], {10, 11})
+
+
+def decoded(value):
+    """Replace plotly typed-array specs with plain lists for comparison."""
+
+    if isinstance(value, dict) and {"dtype", "bdata"} <= value.keys():
+        data = base64.b64decode(value["bdata"])
+        return np.frombuffer(data, dtype=value["dtype"]).tolist()
+    if isinstance(value, dict):
+        return {key: decoded(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [decoded(item) for item in value]
+    return value
+
+
+class TemplateRendererTest(unittest.TestCase):
+    def test_figure_matches_a_full_plotly_express_build(self):
+        frame = node_frame(
+            [
+                (44.5 + index * 1e-3, -79.9, f"Street {index}", index / 10)
+                for index in range(12)
+            ]
+        )
+        frame.loc[3, "sz"] = 5
+        frame.loc[4, "names"] = "</script><b>odd</b>"
+
+        expected = heat_map.scatter_figure(
+            frame, "open-street-map", {"lat": frame["lat"].mean(), "lon": frame["lon"].mean()}
+        )
+        heat_map.style_figure(expected)
+        actual = heat_map.heat_map_figure_json(frame, "open-street-map")
+
+        self.assertEqual(decoded(actual), decoded(expected.to_plotly_json()))
+
+    def test_page_data_cannot_close_its_script_element(self):
+        frame = node_frame([(44.5, -79.9, "Lane", 0.2)])
+        frame.loc[0, "names"] = "</script><script>alert(1)</script>"
+        self.assertNotIn("<", heat_map.original_data_json(frame))
+
+
+class ThresholdTest(unittest.TestCase):
+    def test_one_build_emits_nodes_for_every_threshold(self):
+        nodes = {1: (44.5, -79.9), 2: (44.505, -79.9), 3: (44.52, -79.9), 4: (44.55, -79.9)}
+        data = osm_data(
+            nodes, {10: ("Short Lane", 1, 2), 11: ("Long Road", 2, 3), 12: ("Far Road", 3, 4)}
+        )
+        settings = heat_map.load_settings(heat_map.ROOT / "missing.yaml")
+        with (
+            mock.patch.object(heat_map, "load_city_data", return_value=data),
+            mock.patch.object(heat_map, "find_citystrides_file", return_value=None),
+            mock.patch.object(heat_map, "load_boundary", return_value=None),
+        ):
+            rows = heat_map.process_city_data("tiny", settings)
+
+        # Long Road is 1.67 km: above heat_map_max_length but within 2 km.
+        self.assertEqual({row[5] for row in rows}, {"Short Lane", "Long Road"})
+
+    def test_page_options_and_prefixes_follow_the_thresholds(self):
+        frame = node_frame(
+            [(44.5, -79.9, "Long Road", 1.6), (44.6, -79.9, "Lane", 0.2), (44.7, -79.9, "Way", 0.7)]
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / "map.html"
+            heat_map.write_heat_map_html(
+                frame, "open-street-map", output, thresholds=[0.25, 1.0, 2.0]
+            )
+            page = output.read_text(encoding="utf-8")
+
+        self.assertIn('<option value="0.25" selected>0.25 km</option>', page)
+        self.assertIn('<option value="2">2.0 km</option>', page)
+        self.assertIn('window.thresholdEnds = {"0.25": 1, "1": 2, "2": 3}', page)
+        self.assertIn('"len_cat":[0.2,0.7,1.6]', page)
+
+
+class PreviewTest(unittest.TestCase):
+    def test_every_cell_keeps_a_bounded_uniform_sample(self):
+        dense = {index: (44.5 + index * 1e-6, -79.9) for index in range(1, 1001)}
+        data = osm_data(dense | {5000: (44.6, -79.8)}, {})
+        sample, total = heat_map.stratified_sample(data, cell_deg=0.01, per_cell=10)
+
+        self.assertEqual(total, 1001)
+        self.assertEqual(len(sample), 11)
+        self.assertIn(5000, {element["id"] for element in sample})
+        self.assertGreater(max(element["id"] for element in sample if element["id"] < 5000), 10)
+
+    def test_preview_page_reports_its_sample_ratio(self):
+        nodes = {index: (44.5 + index * 1e-4, -79.9) for index in range(1, 41)}
+        data = osm_data(nodes, {10: ("Main Street", *nodes)})
+        settings = heat_map.load_settings(heat_map.ROOT / "missing.yaml")
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            mock.patch.object(heat_map, "load_city_data", return_value=data),
+            mock.patch.object(heat_map, "find_citystrides_file", return_value=None),
+            mock.patch.object(heat_map, "load_boundary", return_value=None),
+        ):
+            output = Path(directory) / "map.html"
+            heat_map.write_preview(["tiny"], settings, output)
+            page = output.read_text(encoding="utf-8")
+            leftovers = [path.name for path in Path(directory).iterdir()]
+
+        self.assertIn("preview: 30.0% of 40 nodes", page)
+        self.assertEqual(leftovers, ["map.html"])
+
+    def test_a_failed_preview_still_leaves_the_full_map(self):
+        nodes = {index: (44.5 + index * 1e-4, -79.9) for index in range(1, 4)}
+        data = osm_data(nodes, {10: ("Main Street", *nodes)})
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            mock.patch.object(heat_map, "load_city_data", return_value=data) as load,
+            mock.patch.object(heat_map, "find_citystrides_file", return_value=None),
+            mock.patch.object(heat_map, "load_boundary", return_value=None),
+            mock.patch.object(heat_map, "stratified_sample", return_value=([], 3)),
+        ):
+            output = Path(directory) / "map.html"
+            nodes_output = Path(directory) / "nodes.csv"
+            argv = ["create_heat_map.py", "tiny", "--preview", "--output", str(output)]
+            with mock.patch("sys.argv", [*argv, "--nodes-output", str(nodes_output)]):
+                self.assertEqual(heat_map.main(), 0)
+            page = output.read_text(encoding="utf-8")
+
+        self.assertNotIn("preview:", page)
+        self.assertIn("Name: 3 (tiny)", page)
+        self.assertEqual(load.call_count, 1)
+
+    def test_previews_follow_the_map_mode(self):
+        nodes = {index: (44.5 + index * 1e-4, -79.9) for index in range(1, 41)}
+        data = osm_data(nodes, {10: ("Main Street", *nodes)})
+        settings = heat_map.load_settings(heat_map.ROOT / "missing.yaml")
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            mock.patch.object(heat_map, "find_citystrides_file", return_value=None),
+            mock.patch.object(heat_map, "load_boundary", return_value=None),
+        ):
+            output = Path(directory) / "map.html"
+            heat_map.write_preview(["tiny"], settings, output, "streets", {"tiny": data})
+            page = output.read_text(encoding="utf-8")
+
+        self.assertIn("preview: 30.0% of 40 nodes", page)
+        self.assertIn("street length", page)
+        self.assertNotIn("window.originalData", page)
+
+
+class IdJoinTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.csnodes = Path(directory.name) / "tiny.csv"
+        self.nodes = {1: (44.5, -79.9), 2: (44.501, -79.9), 3: (44.502, -79.9)}
+        self.data = osm_data(self.nodes, {10: ("Main Street", 1, 2, 3)})
+
+    def process(self, csv_text: str) -> list[list]:
+        self.csnodes.write_text(csv_text)
+        settings = heat_map.load_settings(heat_map.ROOT / "missing.yaml")
+        with (
+            mock.patch.object(heat_map, "ROOT", self.csnodes.parent),
+            mock.patch.object(heat_map, "load_city_data", return_value=self.data),
+            mock.patch.object(heat_map, "find_citystrides_file", return_value=self.csnodes),
+            mock.patch.object(
+                heat_map, "is_close_to_citystrides_node",
+                wraps=heat_map.is_close_to_citystrides_node,
+            ) as spatial,
+        ):
+            rows = heat_map.process_city_data("tiny", settings)
+        self.spatial_calls = spatial.call_count
+        return rows
+
+    def test_osm_node_ids_skip_the_spatial_match(self):
+        rows = self.process(
+            "lat,lon,sz,names,len_cat,osm_node_id\n"
+            "44.5,-79.9,2,Main Street (1),a,1\n"
+            "44.501,-79.9,2,Main Street (2),a,2\n"
+        )
+        self.assertEqual([row[3] for row in rows], ["Name: 1 (tiny)", "Name: 2 (tiny)"])
+        self.assertEqual(self.spatial_calls, 1)
+
+    def test_ids_that_disagree_with_osm_positions_are_ignored(self):
+        rows = self.process(
+            "lat,lon,sz,names,len_cat,node_id\n"
+            "44.501,-79.9,2,Main Street (1),a,1\n"
+        )
+        self.assertEqual([row[3] for row in rows], ["Name: 2 (tiny)"])
+        self.assertEqual(self.spatial_calls, 3)
+
+    def test_rows_with_malformed_ids_fall_back_to_the_spatial_match(self):
+        rows = self.process(
+            "lat,lon,sz,names,len_cat,osm_node_id\n"
+            "44.5,-79.9,2,Main Street (1),a,1\n"
+            "44.501,-79.9,2,Main Street (2),a,\n"
+            "44.502,-79.9,2,Main Street (3),a,n/a\n"
+        )
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(self.spatial_calls, 2)
+
+
+SQUARE_WITH_HOLE = {
+    "type": "Polygon",
+    "coordinates": [
+        [[-80, 44], [-79, 44], [-79, 45], [-80, 45], [-80, 44]],
+        [[-79.6, 44.4], [-79.4, 44.4], [-79.4, 44.6], [-79.6, 44.6], [-79.6, 44.4]],
+    ],
+}
+
+
+class BoundaryTest(unittest.TestCase):
+    def test_points_in_holes_and_outside_the_bbox_are_excluded(self):
+        boundary = boundaries.Boundary(SQUARE_WITH_HOLE)
+        lat = [44.2, 44.5, 44.5, 45.5, 44.9]
+        lon = [-79.8, -79.5, -79.2, -79.5, -80.5]
+        self.assertEqual(boundary.contains(lat, lon).tolist(), [True, False, True, False, False])
+
+    def test_multipolygons_contain_each_part(self):
+        boundary = boundaries.Boundary(
+            {
+                "type": "MultiPolygon",
+                "coordinates": [
+                    [[[0, 0], [1, 0], [1, 1], [0, 0]]],
+                    [[[2, 0], [3, 0], [3, 1], [2, 0]]],
+                ],
+            }
+        )
+        nodes = {1: (0.2, 0.8), 2: (0.2, 2.8), 3: (0.8, 0.2), 4: (0.5, 1.5)}
+        self.assertEqual(boundary.contains_nodes(nodes), {1, 2})
+
+    def test_process_city_data_skips_nodes_outside_the_boundary(self):
+        nodes = {1: (44.5, -79.9), 2: (44.501, -79.9), 3: (44.5, -79.001), 4: (44.5, -78.999)}
+        data = osm_data(nodes, {10: ("Main Street", 1, 2), 11: ("Border Road", 3, 4)})
+        settings = heat_map.load_settings(heat_map.ROOT / "missing.yaml")
+        with (
+            mock.patch.object(heat_map, "load_city_data", return_value=data),
+            mock.patch.object(heat_map, "find_citystrides_file", return_value=None),
+            mock.patch.object(
+                heat_map, "load_boundary",
+                return_value=boundaries.Boundary(SQUARE_WITH_HOLE),
+            ),
+        ):
+            rows = heat_map.process_city_data("tiny", settings)
+
+        self.assertEqual(
+            [row[3] for row in rows],
+            ["Name: 1 (tiny)", "Name: 2 (tiny)", "Name: 3 (tiny)"],
+        )
+
+
+class HotspotTest(unittest.TestCase):
+    def test_dense_cells_merge_and_isolated_nodes_are_noise(self):
+        dense = [
+            (44.5 + i * 0.0002, -79.9 + j * 0.0002, f"Street {i}", 0.1 * (i + 1))
+            for i in range(4)
+            for j in range(4)
+        ]
+        sparse = [(44.6, -79.8, "Far Road", 0.3)]
+        hotspots = cluster_hotspots(node_frame(dense + sparse), 0.25, 8)
+
+        self.assertEqual(len(hotspots), 1)
+        hotspot = hotspots.iloc[0]
+        self.assertEqual(hotspot["nodes"], 16)
+        self.assertEqual(hotspot["streets"], 4)
+        self.assertAlmostEqual(hotspot["remaining_km"], 1.0)
+        self.assertNotIn("Far Road", hotspot["street_names"])
+
+    def test_hotspots_are_ranked_by_street_density(self):
+        crowded = [(44.5, -79.9 + i * 1e-5, f"Lane {i}", 0.2) for i in range(8)]
+        quiet = [(44.7, -79.9 + i * 1e-5, "Long Road", 0.9) for i in range(8)]
+        hotspots = cluster_hotspots(node_frame(quiet + crowded), 0.25, 8)
+
+        self.assertEqual(hotspots["rank"].tolist(), [1, 2])
+        self.assertEqual(hotspots.iloc[0]["streets"], 8)
+        self.assertAlmostEqual(hotspots.iloc[0]["lat"], 44.5)
+
+    def test_empty_input_has_the_table_columns(self):
+        hotspots = cluster_hotspots(node_frame([]))
+        self.assertEqual(list(hotspots.columns), [
+            "rank", "lat", "lon", "nodes", "streets", "area_km2",
+            "streets_per_km2", "remaining_km", "street_names",
+        ])
+
+
+class RasterTest(unittest.TestCase):
+    def test_nodes_are_binned_by_cell_and_weighted_by_inverse_length(self):
+        frame = node_frame(
+            [
+                (44.5, -79.9, "Short Lane", 0.1),
+                (44.50001, -79.90001, "Short Lane", 0.1),
+                (44.5, -79.9, "Long Road", 0.5),
+                (44.6, -79.8, "Far Road", 0.005),
+            ]
+        )
+        cells = heat_map.raster_frame(frame, 0.5).sort_values("lat")
+
+        self.assertEqual(cells["nodes"].tolist(), [3, 1])
+        self.assertEqual(cells["weight"].round(6).tolist(), [22.0, 100.0])
+
+    def test_raster_size_depends_on_the_grid_not_the_node_count(self):
+        points = [
+            (44.5 + (i % 100) * 1e-5, -79.9 + (i // 100) * 1e-5, "Lane", 0.2)
+            for i in range(10_000)
+        ]
+        self.assertEqual(len(heat_map.raster_frame(node_frame(points), 1.0)), 1)
+
+
+class StreetModeTest(unittest.TestCase):
+    def test_simplification_drops_collinear_points_and_keeps_corners(self):
+        straight = np.column_stack([44.5 + np.arange(50) * 1e-4, np.full(50, -79.9)])
+        corner = np.array([[44.5, -79.9], [44.501, -79.9], [44.501, -79.899]])
+        self.assertEqual(len(heat_map.simplify_polyline(straight, 1.0)), 2)
+        self.assertEqual(len(heat_map.simplify_polyline(corner, 1.0)), 3)
+        self.assertEqual(len(heat_map.simplify_polyline(corner, 200.0)), 2)
+
+    def test_streets_with_emitted_nodes_become_polylines(self):
+        nodes = {1: (44.5, -79.9), 2: (44.5005, -79.9), 3: (44.501, -79.9), 4: (44.6, -79.9)}
+        data = osm_data(nodes, {10: ("Main Street", 1, 2, 3), 11: ("Long Road", 3, 4)})
+        settings = heat_map.load_settings(heat_map.ROOT / "missing.yaml")
+        polylines = []
+        with (
+            mock.patch.object(heat_map, "load_city_data", return_value=data),
+            mock.patch.object(heat_map, "find_citystrides_file", return_value=None),
+            mock.patch.object(heat_map, "load_boundary", return_value=None),
+        ):
+            rows = heat_map.process_city_data("tiny", settings, polylines=polylines)
+
+        self.assertEqual([polyline["street"] for polyline in polylines], ["Main Street"])
+        self.assertEqual(polylines[0]["paths"][0].tolist(), [list(nodes[i]) for i in (1, 2, 3)])
+
+        plot = heat_map.heat_map_figure_json(
+            pd.DataFrame(rows, columns=heat_map.NODE_COLUMNS),
+            "open-street-map",
+            polylines=heat_map.simplify_polylines(polylines, 1.0),
+        )
+        self.assertEqual(plot["data"][0]["lat"], [44.5, 44.501, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
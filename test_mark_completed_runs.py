@@ -0,0 +1,106 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+import create_heat_map as heat_map
+import mark_completed_runs as marker
+
+# A route due east along 44.5° N; 0.0001° of latitude is about 11 m.
+ROUTE = np.array([[44.5, -79.9], [44.5, -79.89]])
+
+
+class TargetIndexTest(unittest.TestCase):
+    def test_points_within_the_tolerance_of_a_segment_are_covered(self):
+        points = np.array(
+            [
+                [44.5001, -79.895],  # 11 m from the middle of the segment
+                [44.5004, -79.895],  # 44 m away
+                [44.5, -79.8898],  # 16 m past the east end
+                [44.5, -79.88],  # far beyond the end
+            ]
+        )
+        index = marker.TargetIndex(points, 25)
+        self.assertEqual(index.covered(ROUTE).tolist(), [True, False, True, False])
+
+
+class MarkCityTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.csnodes = Path(directory.name) / "tiny.csv"
+        self.csnodes.write_text(
+            "lat,lon,sz,names,len_cat,node_id\n"
+            "44.5001,-79.895,2,Main Street (1),a,1\n"
+            "44.51,-79.895,2,Side Road (2),a,2\n"
+        )
+        self.csnodes.with_name("tiny.meta.json").write_text(
+            json.dumps({"generated_at": "2026-08-01T12:00:00+00:00"})
+        )
+
+    def route(self, completed_at: str) -> dict:
+        return {
+            "run": f"tiny-{completed_at}.html",
+            "completed_at": marker.parse_time(completed_at),
+            "route": ROUTE,
+        }
+
+    def test_runs_after_the_download_mark_targets_the_heat_map_skips(self):
+        routes = [self.route("2026-07-01T09:00:00-04:00"), self.route("2026-08-02T09:00:00-04:00")]
+        covered, total, used = marker.mark_city(self.csnodes, routes, 25)
+
+        self.assertEqual((covered, total, used), (1, 2, ["tiny-2026-08-02T09:00:00-04:00.html"]))
+        points = heat_map.load_citystrides_points(self.csnodes)
+        self.assertEqual(set().union(*points.values()), {(44.51, -79.895)})
+
+    def test_stale_covered_files_are_removed(self):
+        heat_map.covered_targets_file(self.csnodes).write_text("lat,lon\n44.51,-79.895\n")
+        marker.mark_city(self.csnodes, [self.route("2026-07-01T09:00:00-04:00")], 25)
+        self.assertFalse(heat_map.covered_targets_file(self.csnodes).exists())
+
+
+class RebuildHeatMapTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        for folder in ("data", "heat_maps"):
+            (self.root / folder).mkdir()
+        self.page = self.root / "heat_maps" / "tiny.html"
+        self.page.write_text("old page")
+        for module, name, value in [
+            (heat_map, "ROOT", self.root),
+            (marker, "ROOT", self.root),
+            (heat_map, "find_citystrides_file", lambda city: None),
+            (heat_map, "load_boundary", lambda city: None),
+        ]:
+            patcher = mock.patch.object(module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.settings = heat_map.load_settings(self.root / "missing.yaml")
+
+    def write_street(self, end_lat: float) -> None:
+        nodes = [(1, 44.5), (2, (44.5 + end_lat) / 2), (3, end_lat)]
+        elements = [{"type": "node", "id": i, "lat": lat, "lon": -79.9} for i, lat in nodes]
+        elements.append({"type": "way", "id": 10, "nodes": [1, 2, 3], "tags": {"name": "Lane"}})
+        (self.root / "data" / "tiny.json").write_text(json.dumps({"elements": elements}))
+
+    def test_pages_keep_the_configured_mode_and_hotspots(self):
+        self.write_street(44.501)
+        self.settings |= {"heat_map_mode": "raster", "heat_map_hotspots": True}
+        self.assertEqual(marker.rebuild_heat_map("tiny", self.settings), self.page)
+
+        self.assertIn("Short-street density", self.page.read_text())
+        self.assertTrue(self.page.with_suffix(".hotspots.csv").exists())
+
+    def test_cities_without_short_streets_keep_their_page(self):
+        self.write_street(44.6)
+        self.assertIsNone(marker.rebuild_heat_map("tiny", self.settings))
+        self.assertEqual(self.page.read_text(), "old page")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import contextlib
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+import plan_download_grid as planner
+from boundaries import Boundary
+
+# A square inside the south-west unit cell, in (lon, lat) GeoJSON order.
+SQUARE = {
+    "type": "Polygon",
+    "coordinates": [[[0.2, 0.2], [0.8, 0.2], [0.8, 0.8], [0.2, 0.8], [0.2, 0.2]]],
+}
+
+
+class PlanGridTest(unittest.TestCase):
+    def test_dense_cells_split_and_sparse_cells_stay_merged(self):
+        random = np.random.default_rng(0)
+        dense = random.uniform(0, 0.25, (300, 2))
+        sparse = random.uniform(0.5, 1, (20, 2))
+        lat, lon = np.concatenate([dense, sparse]).T
+        cells = planner.plan_grid((0, 0, 1, 1), lat, lon, None, 100, 0.01, 1)
+
+        sizes = sorted(nelat - swlat for _, nelat, _, swlat in cells)
+        self.assertLess(sizes[0], 0.25)
+        self.assertGreaterEqual(sizes[-1], 0.5)
+        requests, missed = planner.estimated_requests(cells, lat, lon, 100)
+        self.assertEqual(missed, 0)
+        self.assertLessEqual(requests, len(cells))
+        self.assertLess(len(cells), 16)
+
+    def test_empty_cells_outside_the_boundary_are_dropped(self):
+        empty = np.empty(0)
+        boundary = Boundary(SQUARE)
+        cells = planner.plan_grid((0, 0, 3, 3), empty, empty, boundary, 100, 0.1, 1)
+        self.assertEqual(cells, [(1, 1, 0, 0)])
+
+    def test_thin_boundary_strips_between_sample_points_are_kept(self):
+        # A 0.01° strip across the cell with every vertex outside it.
+        strip = Boundary(
+            {
+                "type": "Polygon",
+                "coordinates": [[[-1, 0.4], [2, 0.4], [2, 0.41], [-1, 0.41], [-1, 0.4]]],
+            }
+        )
+        self.assertTrue(planner.touches_boundary(strip, (1, 1, 0, 0)))
+        self.assertFalse(planner.touches_boundary(strip, (1, 2, 0, 1)))
+
+    def test_an_efficient_current_grid_is_never_made_worse(self):
+        # Five nodes in the centre of a 3 x 3 lattice; the other cells are empty.
+        size = planner.CACHE_CELL
+        lattice = [
+            (size * (c + 1), size * (r + 1), size * c, size * r)
+            for r in range(3)
+            for c in range(3)
+        ]
+        lat, lon = np.full(5, size * 1.5), size * (1.1 + np.arange(5) / 10)
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            for folder in ("cache", "csnodes"):
+                (root / folder).mkdir()
+            planner.write_grid(lattice[:4] + lattice[5:], root / "cache" / "tiny.csv")
+            rows = "".join(f"{a},{b}\n" for a, b in zip(lat, lon, strict=True))
+            (root / "csnodes" / "tiny.csv").write_text(f"lat,lon\n{rows}")
+            output = io.StringIO()
+            with (
+                mock.patch.object(planner, "ROOT", root),
+                mock.patch.object(planner, "load_boundary", return_value=None),
+                mock.patch("sys.argv", ["plan_download_grid.py", "tiny"]),
+                contextlib.redirect_stdout(output),
+            ):
+                self.assertEqual(planner.main(), 0)
+            planned = planner.read_grid(root / "cache" / "tiny.planned.csv")
+
+        before, _ = planner.estimated_requests([lattice[4]], lat, lon, 800)
+        after, missed = planner.estimated_requests(planned, lat, lon, 800)
+        self.assertEqual((before, missed), (1, 0))
+        self.assertLessEqual(after, before)
+        self.assertIn("less 8 empty cells: about 1 requests", output.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
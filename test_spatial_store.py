@@ -0,0 +1,96 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import boundaries
+import create_heat_map as heat_map
+import spatial_store as store
+
+NODES = {1: (44.5, -79.9), 2: (44.501, -79.9), 3: (44.502, -79.9), 4: (44.6, -79.9)}
+
+
+def city_data(ways: dict[int, tuple]) -> dict:
+    used = {node_id for _, *path in ways.values() for node_id in path}
+    return {
+        "elements": [
+            {"type": "node", "id": node_id, "lat": lat, "lon": lon}
+            for node_id, (lat, lon) in NODES.items()
+            if node_id in used
+        ]
+        + [
+            {"type": "way", "id": way_id, "nodes": path, "tags": {"name": name}}
+            for way_id, (name, *path) in ways.items()
+        ]
+    }
+
+
+class SpatialStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        for folder in ("data", "csnodes"):
+            (self.root / folder).mkdir()
+        datasets = {
+            "north": city_data({10: ("Main Street", 1, 2), 11: ("Long Road", 2, 4)}),
+            "south": city_data({12: ("Main Street", 1, 2), 13: ("Side Road", 2, 3)}),
+        }
+        for city, data in datasets.items():
+            (self.root / "data" / f"{city}.json").write_text(json.dumps(data))
+        # Node 3 is not a target any more.
+        (self.root / "csnodes" / "south.csv").write_text("lat,lon\n44.5,-79.9\n44.501,-79.9\n")
+        for module, name, value in [
+            (heat_map, "ROOT", self.root),
+            (store, "ROOT", self.root),
+            (boundaries, "BOUNDARY_DIR", self.root / "boundaries"),
+        ]:
+            patcher = mock.patch.object(module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.connection = store.connect(self.root / "spatial.sqlite", create=True)
+        self.addCleanup(self.connection.close)
+        self.settings = heat_map.load_settings(self.root / "missing.yaml")
+
+    def test_area_query_matches_the_per_city_selection(self):
+        for city in ("north", "south"):
+            store.ingest_city(self.connection, city)
+        area = [44.4, -80, 44.7, -79.8]
+
+        for city in ("north", "south"):
+            expected = heat_map.process_city_data(city, self.settings)
+            self.assertEqual(
+                store.query_rows(self.connection, area, self.settings, [city]), expected
+            )
+        names = [row[3] for row in store.query_rows(self.connection, area, self.settings)]
+        # Node 2 lies on north's long road but south's short one.
+        self.assertEqual(names, ["Name: 1 (north)", "Name: 2 (south)"])
+        narrow = store.query_rows(self.connection, [44.4, -80, 44.5005, -79.8], self.settings)
+        self.assertEqual([row[3] for row in narrow], ["Name: 1 (north)"])
+
+    def test_cities_are_reloaded_only_when_their_files_change(self):
+        self.assertIsNotNone(store.ingest_city(self.connection, "south"))
+        self.assertIsNone(store.ingest_city(self.connection, "south"))
+
+        (self.root / "csnodes" / "south.csv").write_text("lat,lon\n44.502,-79.9\n")
+        self.assertEqual(store.ingest_city(self.connection, "south")["targets"], 1)
+        rows = store.query_rows(self.connection, [44.4, -80, 44.7, -79.8], self.settings)
+        self.assertEqual([row[3] for row in rows], ["Name: 3 (south)"])
+
+    def test_street_geometry_is_read_in_bounded_batches(self):
+        store.ingest_city(self.connection, "north")
+        polylines = []
+        with mock.patch.object(store, "ID_CHUNK", 1):
+            store.query_rows(
+                self.connection, [44.4, -80, 44.7, -79.8], self.settings, polylines=polylines
+            )
+
+        self.assertEqual([polyline["street"] for polyline in polylines], ["Main Street"])
+        self.assertEqual(
+            [path.tolist() for path in polylines[0]["paths"]], [[list(NODES[1]), list(NODES[2])]]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
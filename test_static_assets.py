@@ -0,0 +1,60 @@
+import gzip
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import static_assets
+
+RUN_PAGE = """<!doctype html>
+<html><body>
+  <script id="routeData" type="application/json">{"title":"Loop","route":[[43.7,-79.4]]}</script>
+  <script>
+    const data=JSON.parse(document.getElementById('routeData').textContent);
+    document.title=data.title;
+  </script>
+</body></html>
+"""
+
+
+class StaticAssetTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.site = Path(directory.name)
+
+    def test_assets_are_named_by_content_and_replace_older_versions(self):
+        assets = self.site / "assets"
+        first = static_assets.write_asset(assets, "map", "window.a = 1;\n")
+        self.assertEqual(static_assets.write_asset(assets, "map", "window.a = 1;\n"), first)
+        second = static_assets.write_asset(assets, "map", "window.a = 2;\n")
+
+        self.assertNotEqual(first, second)
+        expected = [second, f"{second}.gz", "manifest.json"]
+        if static_assets.brotli is not None:
+            expected.append(f"{second}.br")
+        self.assertEqual(sorted(path.name for path in assets.iterdir()), sorted(expected))
+        self.assertEqual(gzip.decompress((assets / f"{second}.gz").read_bytes()), b"window.a = 2;\n")
+        manifest = json.loads((assets / "manifest.json").read_text())
+        self.assertEqual(manifest["map"]["file"], second)
+
+    def test_run_pages_load_their_route_data_from_an_asset(self):
+        runs = self.site / "past_runs"
+        runs.mkdir()
+        (runs / "loop.html").write_text(RUN_PAGE)
+        self.assertEqual(static_assets.prepare_site(self.site)[0], 1)
+
+        page = (runs / "loop.html").read_text()
+        asset = static_assets.load_manifest(runs / "assets")["loop"]["file"]
+        self.assertNotIn('routeData"', page)
+        self.assertIn(f'<script src="assets/{asset}"></script>', page)
+        self.assertIn("const data=window.routeData;", page)
+        self.assertEqual(
+            (runs / "assets" / asset).read_text(),
+            'window.routeData = {"title":"Loop","route":[[43.7,-79.4]]};\n',
+        )
+        self.assertTrue((runs / "loop.html.gz").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
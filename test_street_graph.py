@@ -0,0 +1,97 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+import create_heat_map as heat_map
+import street_graph as graphs
+
+# A 3 x 3 grid of nodes 0.001° apart; node ids are 1 + 3 * row + column.
+GRID = {
+    1 + 3 * row + column: (44.5 + row * 0.001, -79.9 + column * 0.001)
+    for row in range(3)
+    for column in range(3)
+}
+WAYS = {
+    10: ("First Avenue", [1, 2, 3]),
+    11: ("Second Avenue", [4, 5, 6]),
+    12: ("Third Avenue", [7, 8, 9]),
+    13: ("West Street", [1, 4, 7]),
+    14: ("East Street", [3, 6, 9]),
+}
+
+
+def grid_data() -> dict:
+    return {
+        "elements": [
+            {"type": "node", "id": node_id, "lat": lat, "lon": lon}
+            for node_id, (lat, lon) in GRID.items()
+        ]
+        + [
+            {"type": "way", "id": way_id, "nodes": path, "tags": {"name": name}}
+            for way_id, (name, path) in WAYS.items()
+        ]
+    }
+
+
+class StreetGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = graphs.StreetGraph.from_city_data(grid_data())
+
+    def test_searches_follow_the_streets(self):
+        corner, far_corner, centre = self.graph.index_of([1, 9, 5]).tolist()
+        distance, previous, reached = self.graph.search([corner])
+        # Going north first is shorter: degrees of longitude shrink northwards.
+        expected = graphs.point_distance_m(GRID[1], GRID[7]) + graphs.point_distance_m(
+            GRID[7], GRID[9]
+        )
+        self.assertAlmostEqual(distance[far_corner], expected, places=6)
+        # The centre only joins Second Avenue, so it is reached from a side.
+        self.assertEqual(len(self.graph.path_to(previous, centre)), 3)
+
+        a_star, _, reached = self.graph.search([corner], {far_corner})
+        self.assertEqual(reached, [far_corner])
+        self.assertAlmostEqual(a_star[far_corner], expected, places=6)
+        self.assertEqual(self.graph.index_of([1, 99]).tolist()[1], -1)
+
+    def test_two_opt_removes_a_crossing(self):
+        points = np.array([[0, 0], [0, 1], [1, 1], [1, 0]], dtype=float)
+        matrix = np.linalg.norm(points[:, None] - points[None], axis=2)
+        self.assertEqual(graphs.two_opt(matrix, [0, 2, 1, 3]), [0, 1, 2, 3])
+
+    def test_route_visits_every_short_street_and_returns(self):
+        rows = [
+            [*GRID[node_id], 2, f"Name: {node_id} (grid)", 0.2, name]
+            for name, node_id in [("First Avenue", 3), ("Third Avenue", 7), ("Third Avenue", 9)]
+        ]
+        start = int(self.graph.index_of([1])[0])
+        ordered, path, metres = graphs.plan_route(self.graph, rows, start, stops=5)
+
+        self.assertEqual(
+            sorted(cluster["street"] for cluster in ordered), ["First Avenue", "Third Avenue"]
+        )
+        self.assertEqual((path[0], path[-1]), (start, start))
+        self.assertTrue(set(self.graph.index_of([3, 7, 9]).tolist()) <= set(path))
+        # Around the outside of the grid, without doubling back.
+        perimeter = sum(
+            graphs.point_distance_m(GRID[a], GRID[b]) for a, b in [(1, 3), (3, 9), (9, 7), (7, 1)]
+        )
+        self.assertAlmostEqual(metres, perimeter, places=6)
+
+    def test_graphs_are_cached_until_the_dataset_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            (root / "data").mkdir()
+            (root / "data" / "grid.json").write_text(json.dumps(grid_data()))
+            with mock.patch.object(graphs, "ROOT", root), mock.patch.object(heat_map, "ROOT", root):
+                self.assertFalse(graphs.load_graph("grid")[1])
+                graph, cached = graphs.load_graph("grid")
+                self.assertTrue(cached)
+                self.assertEqual(graph.lengths.tolist(), self.graph.lengths.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()